@@ -0,0 +1,74 @@
+#
+# This file is part of WinPexpect. WinPexpect is free software that is made
+# available under the MIT license. Consult the file "LICENSE" that is
+# distributed together with this file for the exact licensing terms.
+#
+# WinPexpect is copyright (c) 2010-2012 by the WinPexpect authors. See the
+# file "AUTHORS" for a complete overview.
+
+"""Compare the throughput of the asyncio and the blocking backend.
+
+A number of /bin/cat sessions each echo a number of lines. The blocking
+backend handles one session at a time, the asyncio backend sends a line
+to all sessions and then waits for all of them in one event loop.
+"""
+
+from __future__ import print_function
+
+import sys
+import time
+import asyncio
+
+from winpexpect import spawn, NBIO, AsyncioNBIO
+
+
+def start(count, nbio_class):
+    return [spawn('/bin/cat', timeout=10, nbio_class=nbio_class)
+            for i in range(count)]
+
+
+def bench_blocking(sessions, lines):
+    cats = start(sessions, NBIO)
+    begin = time.time()
+    for cat in cats:
+        for i in range(lines):
+            cat.send(b'some line of output\n')
+            cat.expect_exact(b'output\r\n')
+            cat.expect_exact(b'output\r\n')
+    elapsed = time.time() - begin
+    for cat in cats:
+        cat.terminate()
+    return elapsed
+
+
+def bench_asyncio(sessions, lines):
+    loop = asyncio.new_event_loop()
+    cats = start(sessions, AsyncioNBIO)
+    for cat in cats:
+        cat.loop = loop
+    begin = time.time()
+    for i in range(lines):
+        for cat in cats:
+            cat.send(b'some line of output\n')
+        for j in range(2):
+            futures = [cat.expect_exact_async(b'output\r\n') for cat in cats]
+            loop.run_until_complete(asyncio.gather(*futures))
+    elapsed = time.time() - begin
+    for cat in cats:
+        cat.terminate()
+    loop.close()
+    return elapsed
+
+
+def main():
+    sessions = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    lines = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    total = sessions * lines
+    for name, func in (('blocking', bench_blocking),
+                       ('asyncio', bench_asyncio)):
+        elapsed = func(sessions, lines)
+        print('%-10s %8.0f lines/s' % (name, total / elapsed))
+
+
+if __name__ == '__main__':
+    main()
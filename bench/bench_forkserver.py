@@ -0,0 +1,45 @@
+#
+# This file is part of WinPexpect. WinPexpect is free software that is made
+# available under the MIT license. Consult the file "LICENSE" that is
+# distributed together with this file for the exact licensing terms.
+#
+# WinPexpect is copyright (c) 2010-2012 by the WinPexpect authors. See the
+# file "AUTHORS" for a complete overview.
+
+"""Measure the spawn latency with and without a fork server.
+
+The fork server is started first, after which the heap of this process is
+grown to the given number of megabytes.
+"""
+
+from __future__ import print_function
+
+import sys
+import time
+
+from winpexpect.posix import PosixProcess
+from winpexpect.forkserver import ForkServerProcess, start_server
+
+
+def bench(name, process_class, count):
+    start = time.time()
+    for i in range(count):
+        process = process_class('/bin/true')
+        process.start()
+        process.wait()
+    elapsed = time.time() - start
+    print('%-12s %8.2f ms/spawn' % (name, elapsed / count * 1e3))
+
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 1024
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    start_server()
+    heap = [bytearray(1024 * 1024) for i in range(size)]
+    print('heap size: %d MB' % len(heap))
+    bench('forkpty', PosixProcess, count)
+    bench('fork server', ForkServerProcess, count)
+
+
+if __name__ == '__main__':
+    main()
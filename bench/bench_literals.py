@@ -0,0 +1,66 @@
+#
+# This file is part of WinPexpect. WinPexpect is free software that is made
+# available under the MIT license. Consult the file "LICENSE" that is
+# distributed together with this file for the exact licensing terms.
+#
+# WinPexpect is copyright (c) 2010-2012 by the WinPexpect authors. See the
+# file "AUTHORS" for a complete overview.
+
+"""Compare the ways to search for a large number of literal strings.
+
+The input is a long command output that is read in small chunks, with
+the string that is searched for at the very end.
+"""
+
+from __future__ import print_function
+
+import re
+import sys
+import time
+
+from winpexpect.search import Searcher, PatternSet, LiteralSet
+
+
+class OutputStream(object):
+    """A stream that returns `data` in chunks of at most `size` bytes."""
+
+    def __init__(self, data):
+        self.data = data
+        self.pos = 0
+
+    def read(self, size):
+        buf = self.data[self.pos:self.pos+size]
+        self.pos += len(buf)
+        return buf
+
+
+def bench(name, pattern, data, exact):
+    searcher = Searcher(OutputStream(data), maxread=4096)
+    search = searcher.search_exact if exact else searcher.search
+    start = time.time()
+    search(pattern)
+    elapsed = time.time() - start
+    print('%-30s %8.2f MB/s' % (name, len(data) / elapsed / 1e6))
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    literals = ['%%ERROR-%d: operation failed' % i for i in range(count)]
+    data = ''.join(['interface GigabitEthernet0/%d\n description uplink\n'
+                    % i for i in range(50000)])
+    data += literals[-1]
+    print('%d literals, %d bytes' % (count, len(data)))
+    try:
+        patterns = PatternSet(list(map(re.escape, literals)))
+    except AssertionError:
+        # Python 2 supports at most 100 groups in a regular expression
+        print('%-30s %8s' % ('regex alternation', 'n/a'))
+    else:
+        bench('regex alternation', patterns, data, False)
+    bench('LiteralSet (find)', LiteralSet(literals), data, True)
+    bench('LiteralSet (automaton)', LiteralSet(literals, automaton=True),
+          data, True)
+
+
+if __name__ == '__main__':
+    main()
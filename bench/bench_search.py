@@ -0,0 +1,62 @@
+#
+# This file is part of WinPexpect. WinPexpect is free software that is made
+# available under the MIT license. Consult the file "LICENSE" that is
+# distributed together with this file for the exact licensing terms.
+#
+# WinPexpect is copyright (c) 2010-2012 by the WinPexpect authors. See the
+# file "AUTHORS" for a complete overview.
+
+"""Measure the per-expect overhead of Searcher.search().
+
+Each search matches a prompt that is already available from the stream,
+so the time measured is dominated by the setup cost of the search.
+"""
+
+from __future__ import print_function
+
+import sys
+import time
+
+from winpexpect.search import Searcher, PatternSet, LiteralSet
+from winpexpect.exception import EOF, TIMEOUT
+
+
+class PromptStream(object):
+    """A stream that returns a line of output followed by a prompt."""
+
+    chunk = 'some output\r\nrouter# '
+
+    def read(self, size):
+        return self.chunk
+
+
+PATTERNS = ['router# ', 'router\\(config\\)# ', '[Pp]assword: ',
+            '--More--', 'Invalid input', EOF, TIMEOUT]
+
+LITERALS = ['router# ', 'router(config)# ', 'Password: ', '--More--',
+            'Invalid input', EOF, TIMEOUT]
+
+
+def bench(name, pattern_func, count=100000, exact=False):
+    searcher = Searcher(PromptStream())
+    search = searcher.search_exact if exact else searcher.search
+    start = time.time()
+    for i in range(count):
+        search(pattern_func())
+    elapsed = time.time() - start
+    print('%-30s %8.2f us/expect' % (name, elapsed / count * 1e6))
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    compiled = PatternSet(PATTERNS)
+    bench('uncached (compile per call)', lambda: PatternSet(PATTERNS), count)
+    bench('cached pattern list', lambda: PATTERNS, count)
+    bench('precompiled PatternSet', lambda: compiled, count)
+    literals = LiteralSet(LITERALS)
+    bench('search_exact', lambda: LITERALS, count, True)
+    bench('precompiled LiteralSet', lambda: literals, count, True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,36 @@
+#
+# This file is part of WinPexpect. WinPexpect is free software that is made
+# available under the MIT license. Consult the file "LICENSE" that is
+# distributed together with this file for the exact licensing terms.
+#
+# WinPexpect is copyright (c) 2010-2012 by the WinPexpect authors. See the
+# file "AUTHORS" for a complete overview.
+
+"""Measure the number of spawns per second for each way to start a child."""
+
+from __future__ import print_function
+
+import sys
+import time
+
+from winpexpect.posix import PosixProcess, PosixSpawnProcess
+
+
+def bench(name, process_class, count):
+    start = time.time()
+    for i in range(count):
+        process = process_class('/bin/true')
+        process.start()
+        process.wait()
+    elapsed = time.time() - start
+    print('%-12s %8.0f spawns/s' % (name, count / elapsed))
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    bench('forkpty', PosixProcess, count)
+    bench('posix_spawn', PosixSpawnProcess, count)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,38 @@
+#
+# This file is part of WinPexpect. WinPexpect is free software that is made
+# available under the MIT license. Consult the file "LICENSE" that is
+# distributed together with this file for the exact licensing terms.
+#
+# WinPexpect is copyright (c) 2010-2012 by the WinPexpect authors. See the
+# file "AUTHORS" for a complete overview.
+
+"""Compare spawn() with spawning from a SpawnTemplate."""
+
+from __future__ import print_function
+
+import sys
+import time
+
+from winpexpect import spawn, spawn_many, SpawnTemplate
+
+
+def bench(name, func, count):
+    start = time.time()
+    sessions = func(count)
+    elapsed = time.time() - start
+    for session in sessions:
+        session.kill(9)
+        session.wait()
+    print('%-12s %8.0f spawns/s' % (name, count / elapsed))
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    command = 'sleep 60'
+    bench('spawn', lambda n: [spawn(command) for i in range(n)], count)
+    template = SpawnTemplate(command)
+    bench('template', lambda n: spawn_many(template, n), count)
+
+
+if __name__ == '__main__':
+    main()
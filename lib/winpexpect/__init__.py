@@ -6,17 +6,28 @@
 # WinPexpect is copyright (c) 2010-2012 by the WinPexpect authors. See the
 # file "AUTHORS" for a complete overview.
 
-__all__ = ['spawn', 'Process', 'Terminal', 'NBIO', 'Searcher',
-           'EOF', 'TIMEOUT']
+__all__ = ['spawn', 'spawn_many', 'Spawn', 'SpawnTemplate', 'terminate_all',
+           'start_reaper', 'Process', 'Terminal', 'NBIO', 'Searcher',
+           'PatternSet', 'LiteralSet', 'FixedReadPolicy', 'AdaptiveReadPolicy',
+           'TerminalModes', 'ExpectGroup', 'ForkServerProcess', 'EOF',
+           'TIMEOUT', 'ProcessError']
 
+import os
 import sys
+import signal
 
 from winpexpect.exception import *
-from winpexpect.search import Searcher
+from winpexpect.search import Searcher, PatternSet, LiteralSet
+from winpexpect.readpolicy import FixedReadPolicy, AdaptiveReadPolicy
+from winpexpect.spawn import Spawn, SpawnConfig, spawn_class
 
-if sys.platform in ('linux2', 'darwin'):
+if sys.platform.startswith('linux') or sys.platform == 'darwin':
     from winpexpect.posix import (PosixProcess as Process,
-            PosixTerminal as Terminal, PosixNBIO as NBIO)
+            PosixTerminal as Terminal, PosixNBIO as NBIO, TerminalModes,
+            terminate_all, split_command_line, which)
+    from winpexpect.group import ExpectGroup
+    from winpexpect.forkserver import ForkServerProcess
+    from winpexpect.reaper import start_reaper
 
 else:
     raise RuntimeError('This platform is not supported')
@@ -29,6 +40,14 @@ else:
     from winpexpect.gevent import GEventNBIO
     __all__.append('GEventNBIO')
 
+try:
+    import asyncio
+except ImportError:
+    pass
+else:
+    from winpexpect.asyncio import AsyncioNBIO
+    __all__.append('AsyncioNBIO')
+
 
 default_process_class = Process
 default_terminal_class = Terminal
@@ -37,23 +56,121 @@ default_nbio_class = NBIO
 
 def spawn(command, args=[], cwd=None, env=None, timeout=30,
           maxread=200, searchwindowsize=None, ignorecase=False,
-          process_class=None, terminal_class=None, nbio_class=None):
-    """Spawn a command and return a `Spawn` instance."""
+          process_class=None, terminal_class=None, nbio_class=None,
+          text=False, readpolicy=None, termmodes=None):
+    """Spawn a command and return a `Spawn` instance.
+
+    The output of the command is not decoded and it is searched for with
+    bytes patterns. Use ``decode()`` to decode it. If `text` is set, the
+    output is decoded using the encoding of the command's locale, and it is
+    searched for with text patterns.
+
+    The `termmodes` argument can be used to pass a `TerminalModes` that is
+    set on the pty before the command starts. Turning off echo and the
+    translation of NL to CR-NL reduces the output that needs to be
+    searched.
+
+    The `readpolicy` argument specifies how many bytes to read at a time.
+    The default is an `AdaptiveReadPolicy` that reads at least `maxread`
+    bytes, and more if the command produces a lot of output.
+    """
     if process_class is None:
         process_class = default_process_class
     if terminal_class is None:
         terminal_class = default_terminal_class
     if nbio_class is None:
         nbio_class = default_nbio_class
-    def __init__(self):
-        process_class.__init__(self, command, args, cwd, env)
-        process_class.start(self)
-        fd = process_class.fileno(self)
-        terminal_class.__init__(self, fd)
-        nbio_class.__init__(self, fd, timeout)
-        Searcher.__init__(self, fd, maxread, searchwindowsize, ignorecase)
-        self.expect = self.search
-        self.send = self.write
-    cls = type('Spawn', (nbio_class, process_class, terminal_class, Searcher),
-               { '__init__': __init__ })
-    return cls()
+    if readpolicy is None:
+        readpolicy = AdaptiveReadPolicy(maxread)
+    cls = spawn_class(nbio_class, process_class, terminal_class)
+    return cls(command, args, cwd, env, timeout, maxread, searchwindowsize,
+               ignorecase, text, readpolicy, termmodes)
+
+
+class SpawnTemplate(object):
+    """Spawn the same command many times.
+
+    The arguments are the same as for `spawn()`. The command line is
+    parsed, the executable is looked up in $PATH, and the environment and
+    its encoding are determined once, when the template is created. The
+    environment is copied, so later changes to it have no effect.
+
+    The configuration is stored in the `SpawnConfig` in `config`, which
+    the spawned sessions share.
+
+    A read policy belongs to a single session, so `readpolicy`, if
+    provided, must be a function that returns a new `ReadPolicy`.
+    """
+
+    def __init__(self, command, args=[], cwd=None, env=None, timeout=30,
+                 maxread=200, searchwindowsize=None, ignorecase=False,
+                 process_class=None, terminal_class=None, nbio_class=None,
+                 text=False, readpolicy=None, termmodes=None):
+        if process_class is None:
+            process_class = default_process_class
+        if terminal_class is None:
+            terminal_class = default_terminal_class
+        if nbio_class is None:
+            nbio_class = default_nbio_class
+        if args:
+            args = [command] + list(args)
+        else:
+            args = split_command_line(command)
+        path = which(args[0])
+        if path is None:
+            raise ProcessError('Could not find %s in $PATH' % args[0])
+        if env is None:
+            env = os.environ
+        env = dict(env)
+        encoding = process_class._get_encoding(env)
+        self.config = SpawnConfig(args[0], args, cwd, env, None, (),
+                                  termmodes, encoding, maxread,
+                                  searchwindowsize, ignorecase, not text)
+        self.path = path
+        self.timeout = timeout
+        self.readpolicy = readpolicy
+        self.spawn_class = spawn_class(nbio_class, process_class,
+                                       terminal_class)
+
+    def spawn(self):
+        """Spawn the command and return a `Spawn` instance."""
+        cls = self.spawn_class
+        config = self.config
+        session = cls.__new__(cls)
+        # The command line was parsed already, pass it as a list.
+        if config.termmodes is None:
+            cls.process_class.__init__(session, config.args, None,
+                                       config.cwd, config.env)
+        else:
+            cls.process_class.__init__(session, config.args, None,
+                                       config.cwd, config.env,
+                                       termmodes=config.termmodes)
+        cls.process_class._start(session, self.path, config.env,
+                                 config.encoding)
+        if self.readpolicy is None:
+            readpolicy = AdaptiveReadPolicy(config.maxread)
+        else:
+            readpolicy = self.readpolicy()
+        session._setup(self.timeout, config.maxread, config.searchwindowsize,
+                       config.ignorecase, not config.binary, readpolicy)
+        # Share the configuration instead of the copy the session made.
+        session._config = config
+        return session
+
+
+def spawn_many(template, count):
+    """Spawn `count` instances of the `SpawnTemplate` `template`.
+
+    The return value is a list of `Spawn` instances. If spawning fails, the
+    instances that were already started are killed.
+    """
+    sessions = []
+    try:
+        for i in range(count):
+            sessions.append(template.spawn())
+    except Exception:
+        for session in sessions:
+            session.kill(signal.SIGKILL)
+            session.wait()
+        raise
+    return sessions
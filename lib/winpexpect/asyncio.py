@@ -0,0 +1,194 @@
+#
+# This file is part of WinPexpect. WinPexpect is free software that is made
+# available under the MIT license. Consult the file "LICENSE" that is
+# distributed together with this file for the exact licensing terms.
+#
+# WinPexpect is copyright (c) 2010-2012 by the WinPexpect authors. See the
+# file "AUTHORS" for a complete overview.
+
+from __future__ import absolute_import
+
+import os
+import fcntl
+import errno
+import asyncio
+
+from winpexpect import compat
+from winpexpect.exception import TIMEOUT
+from winpexpect.posix import PosixNBIO
+
+
+class AsyncioNBIO(PosixNBIO):
+    """Non-blocking IO support for asyncio.
+
+    The file descriptor is always in non-blocking mode. The regular
+    methods can still be used and block like they do for `PosixNBIO`. In
+    addition, the methods ending in ``_async`` return a future and wait
+    for the file descriptor with ``loop.add_reader()`` and
+    ``loop.add_writer()``, so that many spawn objects can be driven from
+    one event loop.
+
+    This class must be combined with a `Searcher` and a `Process`, as is
+    done by `spawn()`.
+    """
+
+    def __init__(self, fd, timeout=None, loop=None):
+        self.loop = loop
+        PosixNBIO.__init__(self, fd, timeout)
+
+    def settimeout(self, timeout):
+        self.timeout = timeout
+        flags = fcntl.fcntl(self.fd, fcntl.F_GETFL)
+        fcntl.fcntl(self.fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+
+    def _getloop(self):
+        if self.loop is None:
+            return asyncio.get_event_loop()
+        return self.loop
+
+    def expect_async(self, pattern, timeout=-1):
+        """Like ``expect()`` but return a future with the result."""
+        pattern = self._compile(pattern, self.ignorecase)
+        return self._search_async(pattern, timeout)
+
+    def expect_exact_async(self, pattern, timeout=-1):
+        """Like ``expect_exact()`` but return a future with the result."""
+        pattern = self._compile_exact(pattern)
+        return self._search_async(pattern, timeout)
+
+    def _search_async(self, pattern, timeout):
+        """Search for the compiled pattern set `pattern`."""
+        loop = self._getloop()
+        future = loop.create_future()
+        index = self._scan(pattern)
+        if index is not None:
+            future.set_result(index)
+            return future
+        if timeout == -1:
+            timeout = self.timeout
+        handles = []
+        def finish(result, exception=None):
+            if exception is None:
+                future.set_result(result)
+            else:
+                future.set_exception(exception)
+        def fail(exception):
+            try:
+                finish(self._fail(pattern, exception))
+            except Exception as e:
+                finish(None, e)
+        def readable():
+            if future.done():
+                return
+            saved, self.timeout = self.timeout, 0
+            try:
+                self._readstep(self.readpolicy, self.maxread,
+                               self.searchwindowsize)
+            except TIMEOUT:
+                # Nothing to read after all.
+                return
+            except Exception as e:
+                return fail(e)
+            finally:
+                self.timeout = saved
+            index = self._scan(pattern)
+            if index is not None:
+                finish(index)
+        def expired():
+            if not future.done():
+                fail(TIMEOUT('Timeout exceeded'))
+        def cleanup(future):
+            loop.remove_reader(self.fd)
+            for handle in handles:
+                handle.cancel()
+        loop.add_reader(self.fd, readable)
+        if timeout is not None:
+            handles.append(loop.call_later(timeout, expired))
+        future.add_done_callback(cleanup)
+        return future
+
+    def send_async(self, buf, timeout=-1):
+        """Like ``send()`` but return a future with the number of bytes
+        written."""
+        if isinstance(buf, compat.unicode):
+            buf = buf.encode(self.encoding or 'ascii')
+        loop = self._getloop()
+        future = loop.create_future()
+        if timeout == -1:
+            timeout = self.timeout
+        buf = memoryview(buf)
+        state = [0]
+        handles = []
+        def writable():
+            if future.done():
+                return
+            try:
+                while state[0] != len(buf):
+                    state[0] += os.write(self.fd, buf[state[0]:])
+            except OSError as e:
+                if e.errno not in (errno.EAGAIN, errno.EINTR):
+                    future.set_exception(e)
+                return
+            future.set_result(state[0])
+        def expired():
+            if not future.done():
+                future.set_exception(TIMEOUT('Timeout writing to fd'))
+        def cleanup(future):
+            loop.remove_writer(self.fd)
+            for handle in handles:
+                handle.cancel()
+        writable()
+        if not future.done():
+            loop.add_writer(self.fd, writable)
+            if timeout is not None:
+                handles.append(loop.call_later(timeout, expired))
+            future.add_done_callback(cleanup)
+        return future
+
+    def wait_async(self, timeout=None, interval=0.1):
+        """Like ``wait()`` but return a future with the result.
+
+        If the process has a pidfd, the exit of the child is waited for with
+        ``loop.add_reader()`` on it. Otherwise the child is polled every
+        `interval` seconds.
+        """
+        loop = self._getloop()
+        future = loop.create_future()
+        if not self.isalive():
+            future.set_result(True)
+            return future
+        handles = []
+        pidfd = self.pidfd
+        watching = [pidfd is not None]
+        def unwatch():
+            if watching[0]:
+                loop.remove_reader(pidfd)
+                watching[0] = False
+        def check():
+            if future.done():
+                return
+            # Reaping the child closes the pidfd, so stop watching it first.
+            unwatch()
+            if not self.isalive():
+                future.set_result(True)
+            elif pidfd is None:
+                handles.append(loop.call_later(interval, check))
+            else:
+                # The pidfd is readable, but a reaper thread may not have
+                # recorded the exit status yet.
+                handles.append(loop.call_later(0.001, check))
+        def expired():
+            if not future.done():
+                future.set_result(False)
+        def cleanup(future):
+            unwatch()
+            for handle in handles:
+                handle.cancel()
+        if pidfd is None:
+            handles.append(loop.call_later(interval, check))
+        else:
+            loop.add_reader(pidfd, check)
+        if timeout is not None:
+            handles.append(loop.call_later(timeout, expired))
+        future.add_done_callback(cleanup)
+        return future
@@ -0,0 +1,141 @@
+#
+# This file is part of WinPexpect. WinPexpect is free software that is made
+# available under the MIT license. Consult the file "LICENSE" that is
+# distributed together with this file for the exact licensing terms.
+#
+# WinPexpect is copyright (c) 2010-2012 by the WinPexpect authors. See the
+# file "AUTHORS" for a complete overview.
+
+import re
+
+from winpexpect import compat
+
+
+def _symbols(s):
+    """Return the symbols of `s` as a sequence of integers."""
+    if isinstance(s, bytearray):
+        return s
+    elif isinstance(s, compat.unicode):
+        return [ord(c) for c in s]
+    else:
+        return bytearray(s)
+
+
+def _skip_regex(symbols, text):
+    """Return a regular expression that matches any of `symbols`.
+
+    If `text` is not set, a bytes expression is returned, or None if not
+    all symbols are bytes.
+    """
+    if text:
+        chars = [re.escape(compat.unichr(sym)) for sym in symbols]
+        return re.compile(u'[%s]' % u''.join(chars))
+    if max(symbols) > 255:
+        return None
+    chars = [re.escape(bytes(bytearray([sym]))) for sym in symbols]
+    return re.compile(b'[' + b''.join(chars) + b']')
+
+
+class Automaton(object):
+    """An Aho-Corasick automaton that matches a list of literal strings.
+
+    The automaton looks at each symbol of the input at most once, no matter
+    how many strings it matches. Input that cannot start a string is
+    skipped with a regular expression. Its state can be saved after
+    scanning a piece of input and used to continue scanning when more input
+    arrives.
+
+    Strings are matched by code point, so the automaton can be used on
+    both bytes and text.
+    """
+
+    def __init__(self, literals):
+        """Constructor.
+
+        The `literals` argument must be a list of strings.
+        """
+        goto = [{}]
+        output = [None]
+        for ix,literal in enumerate(literals):
+            state = 0
+            for sym in _symbols(literal):
+                next = goto[state].get(sym)
+                if next is None:
+                    next = len(goto)
+                    goto[state][sym] = next
+                    goto.append({})
+                    output.append(None)
+                state = next
+            if output[state] is None:
+                output[state] = (ix, len(literal))
+        # Turn the trie into a deterministic automaton by filling in the
+        # failure transitions breadth first. A state's transitions are
+        # those of its failure state, overridden by its own.
+        fail = [0] * len(goto)
+        delta = [None] * len(goto)
+        delta[0] = dict(goto[0])
+        queue = list(goto[0].values())
+        for state in queue:
+            for sym,next in goto[state].items():
+                fail[next] = delta[fail[state]].get(sym, 0)
+                queue.append(next)
+            delta[state] = dict(delta[fail[state]])
+            delta[state].update(goto[state])
+            # The longest string that ends here is either our own, or the
+            # longest one that ends in the failure state.
+            if output[state] is None:
+                output[state] = output[fail[state]]
+        self.delta = delta
+        self.output = output
+        # In the start state, the input up to the next symbol that starts a
+        # string is skipped with a regular expression, which runs in C. This
+        # is where most of the time is spent with typical input. If most
+        # symbols start a string, skipping does not pay off.
+        firsts = sorted(goto[0])
+        if firsts and len(firsts) <= 32:
+            self._skiptext = _skip_regex(firsts, True)
+            self._skipbytes = _skip_regex(firsts, False)
+        else:
+            self._skiptext = self._skipbytes = None
+        self.literals = list(literals)
+        self.maxlen = max([len(literal) for literal in literals] or [0])
+
+    def scan(self, data, pos, end, state=0):
+        """Scan `data[pos:end]` starting in automaton state `state`.
+
+        The return value is a (match, state) tuple. If no string was found,
+        `match` is None and `state` is the state to continue scanning with.
+        If a string was found, `match` is a (index, start, end) tuple. Like
+        with ``find()``, the match that starts first wins, and if multiple
+        strings start at the same position, the first one in the list wins.
+        """
+        delta = self.delta
+        output = self.output
+        if isinstance(data, compat.unicode):
+            skip = self._skiptext
+        else:
+            skip = self._skipbytes
+        syms = _symbols(data[pos:end])
+        base = pos
+        best = None
+        limit = end
+        while pos < limit:
+            if state == 0 and skip is not None:
+                # Nothing can match before the first symbol of a string.
+                match = skip.search(data, pos, limit)
+                if match is None:
+                    break
+                pos = match.start()
+            state = delta[state].get(syms[pos-base], 0)
+            pos += 1
+            if output[state] is not None:
+                ix, size = output[state]
+                start = pos - size
+                if best is None:
+                    best = (ix, start, pos)
+                    # Strings that start at or before this one end at or
+                    # before `start + maxlen`.
+                    limit = min(end, start + self.maxlen)
+                elif start < best[1] or (start == best[1] and ix < best[0]):
+                    best = (ix, start, pos)
+        return best, state
@@ -0,0 +1,167 @@
+#
+# This file is part of WinPexpect. WinPexpect is free software that is made
+# available under the MIT license. Consult the file "LICENSE" that is
+# distributed together with this file for the exact licensing terms.
+#
+# WinPexpect is copyright (c) 2010-2012 by the WinPexpect authors. See the
+# file "AUTHORS" for a complete overview.
+
+from winpexpect import compat
+
+
+def extract(data, i, j):
+    """Return ``data[i:j]`` as bytes or text.
+
+    The `data` argument is the `data` attribute of a `Buffer`. This can be
+    used to extract data from a buffer at a later time. Buffers never
+    modify data in place other than by appending to it.
+    """
+    buf = data[i:j]
+    if isinstance(buf, bytearray):
+        buf = bytes(buf)
+    return buf
+
+
+class Buffer(object):
+    """A growable buffer with cheap consumption from the front.
+
+    Bytes are stored in a preallocated bytearray. New data is written into
+    the free space at its end, either by `append()` or by reading directly
+    into the memoryview returned by `reserve()`. When there is not enough
+    free space, the data is moved to a new bytearray of twice the size, so
+    appending is amortized O(1). Text is stored in a string, and a buffer
+    for text is created by setting `text`. Strings cannot grow in place, so
+    appended text is collected in a list that is joined onto the string
+    when `data` is next accessed.
+
+    Consuming data from the front only advances a read offset. The consumed
+    prefix is discarded once it makes up the larger part of the buffer, so
+    that the cost of discarding it is amortized over the data that was
+    consumed.
+
+    The unconsumed data is ``data[start:end]``. The `data`, `start` and
+    `end` attributes are exposed so that the data can be searched in place.
+    The data before `end` is never modified in place.
+    """
+
+    __slots__ = ('_data', '_chunks', 'start', 'end')
+
+    compact_threshold = 4096
+
+    def __init__(self, text=False):
+        self._data = u'' if text else bytearray()
+        self._chunks = []
+        self.start = 0
+        self.end = 0
+
+    def _getdata(self):
+        if self._chunks:
+            self._chunks.insert(0, self._data)
+            self._data = self._data[:0].join(self._chunks)
+            del self._chunks[:]
+        return self._data
+
+    def _setdata(self, data):
+        self._data = data
+        del self._chunks[:]
+
+    data = property(_getdata, _setdata)
+
+    def __len__(self):
+        return self.end - self.start
+
+    def _realloc(self, size):
+        """Move the unconsumed data to a new bytearray with room for at
+        least `size` more bytes."""
+        length = self.end - self.start
+        data = bytearray(max(2*length, length + size))
+        data[:length] = memoryview(self._data)[self.start:self.end]
+        self._data = data
+        self.start = 0
+        self.end = length
+
+    def reserve(self, size):
+        """Return a memoryview of `size` bytes of free space at the end of
+        the buffer. Call `commit()` once data has been written to it."""
+        if not isinstance(self._data, bytearray):
+            if self.end > self.start:
+                raise TypeError('Cannot append bytes to a buffer with text')
+            self._data = bytearray()
+            self.start = self.end = 0
+        if len(self._data) - self.end < size:
+            self._realloc(size)
+        return memoryview(self._data)[self.end:self.end+size]
+
+    def commit(self, nbytes):
+        """Add `nbytes` bytes that were written to the reserved space."""
+        self.end += nbytes
+
+    def append(self, buf):
+        """Append `buf` to the buffer."""
+        if not buf:
+            return
+        if isinstance(buf, compat.unicode):
+            if isinstance(self._data, bytearray):
+                if self.end > self.start:
+                    raise TypeError('Cannot append text to a buffer with bytes')
+                self.data = buf[:0]
+                self.start = self.end = 0
+            self._chunks.append(buf)
+            self.end += len(buf)
+        else:
+            self.reserve(len(buf))[:] = buf
+            self.commit(len(buf))
+
+    def consume(self, pos):
+        """Consume the data up to offset `pos` in `data`."""
+        self.start = pos
+        if pos == self.end:
+            # Do not reuse the space. The old data may still be referenced.
+            self.data = self._data[:0]
+            self.start = self.end = 0
+        elif pos >= self.compact_threshold and 2*pos >= self.end:
+            self.compact()
+
+    def compact(self):
+        """Discard the consumed data, so that `start` becomes 0."""
+        if not self.start:
+            return
+        if isinstance(self._data, bytearray):
+            self._realloc(0)
+        else:
+            self.data = self.data[self.start:]
+            self.start = 0
+            self.end = len(self.data)
+
+    def shrink(self):
+        """Discard the consumed data and free the spare space."""
+        if not isinstance(self._data, bytearray):
+            self.compact()
+        elif len(self._data) != len(self):
+            data = memoryview(self._data)[self.start:self.end]
+            self._data = bytearray(data)
+            self.start = 0
+            self.end = len(self._data)
+
+    def trim(self, size):
+        """Consume data from the front until at most `size` bytes remain.
+
+        The return value is the number of bytes that were consumed.
+        """
+        excess = len(self) - size
+        if excess <= 0:
+            return 0
+        self.consume(self.start + excess)
+        return excess
+
+    def clear(self):
+        """Consume all data."""
+        self.consume(self.end)
+
+    def slice(self, i, j):
+        """Return ``data[i:j]`` as bytes or text."""
+        return extract(self.data, i, j)
+
+    def getvalue(self):
+        """Return the unconsumed data."""
+        return self.slice(self.start, self.end)
@@ -6,13 +6,69 @@
 # WinPexpect is copyright (c) 2010-2012 by the WinPexpect authors. See the
 # file "AUTHORS" for a complete overview.
 
+import os
+import io
 import sys
+import time
+import errno
 
 if sys.version_info[0] == 3:
     unicode = str
     basestring = str
+    unichr = chr
     buffer = memoryview
 else:
     unicode = unicode
     basestring = basestring
+    unichr = unichr
     buffer = buffer
+
+
+if hasattr(os, 'readv'):
+    def readinto(fd, buf):
+        """Read from file descriptor `fd` into the writable buffer `buf`."""
+        return os.readv(fd, [buf])
+else:
+    def readinto(fd, buf):
+        """Read from file descriptor `fd` into the writable buffer `buf`."""
+        fobj = io.FileIO(fd, 'r', closefd=False)
+        try:
+            nbytes = fobj.readinto(buf)
+        except IOError as e:
+            raise OSError(e.errno, e.strerror)
+        if nbytes is None:
+            raise OSError(errno.EAGAIN, os.strerror(errno.EAGAIN))
+        return nbytes
+
+
+def _clock_gettime():
+    """Return clock_gettime() from the C library, or None."""
+    try:
+        import ctypes
+        import ctypes.util
+        libc = ctypes.CDLL(ctypes.util.find_library('c'))
+        return libc.clock_gettime
+    except (ImportError, OSError, AttributeError, TypeError):
+        return
+
+
+if hasattr(time, 'monotonic'):
+    monotonic = time.monotonic
+elif _clock_gettime() is None:
+    monotonic = time.time
+else:
+    import ctypes
+
+    class _timespec(ctypes.Structure):
+        _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+
+    _clock = _clock_gettime()
+    # The value of CLOCK_MONOTONIC is 1 on Linux and 6 on macOS.
+    _CLOCK_MONOTONIC = 6 if sys.platform == 'darwin' else 1
+
+    def monotonic():
+        """Return the value of a monotonic clock in seconds."""
+        ts = _timespec()
+        if _clock(_CLOCK_MONOTONIC, ctypes.byref(ts)) != 0:
+            raise OSError(ctypes.get_errno(), 'clock_gettime() failed')
+        return ts.tv_sec + ts.tv_nsec * 1e-9
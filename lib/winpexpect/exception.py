@@ -12,3 +12,6 @@ class EOF(Exception):
 
 class TIMEOUT(Exception):
     """Timeout."""
+
+class ProcessError(Exception):
+    """The child process could not be started."""
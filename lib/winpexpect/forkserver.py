@@ -0,0 +1,255 @@
+#
+# This file is part of WinPexpect. WinPexpect is free software that is made
+# available under the MIT license. Consult the file "LICENSE" that is
+# distributed together with this file for the exact licensing terms.
+#
+# WinPexpect is copyright (c) 2010-2012 by the WinPexpect authors. See the
+# file "AUTHORS" for a complete overview.
+
+import os
+import time
+import array
+import struct
+import signal
+import socket
+import threading
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+from winpexpect.exception import ProcessError
+from winpexpect.posix import PosixProcess, closefrom, forkpty
+
+
+def sendfd(sock, fd):
+    """Send file descriptor `fd` over the Unix socket `sock`."""
+    if hasattr(sock, 'sendmsg'):
+        fds = array.array('i', [fd])
+        sock.sendmsg([b'F'], [(socket.SOL_SOCKET, socket.SCM_RIGHTS, fds)])
+    else:
+        import _multiprocessing
+        _multiprocessing.sendfd(sock.fileno(), fd)
+
+
+def recvfd(sock):
+    """Receive a file descriptor over the Unix socket `sock`."""
+    if hasattr(sock, 'recvmsg'):
+        fds = array.array('i')
+        size = socket.CMSG_SPACE(fds.itemsize)
+        msg, ancdata, flags, addr = sock.recvmsg(1, size)
+        for level, type, data in ancdata:
+            if level == socket.SOL_SOCKET and type == socket.SCM_RIGHTS:
+                fds.frombytes(data[:fds.itemsize])
+                return fds[0]
+        raise EOFError('No file descriptor received')
+    else:
+        import _multiprocessing
+        return _multiprocessing.recvfd(sock.fileno())
+
+
+def _recvall(sock, size):
+    """Receive exactly `size` bytes from `sock`."""
+    chunks = []
+    while size:
+        chunk = sock.recv(size)
+        if not chunk:
+            raise EOFError('Fork server connection closed')
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+
+def _send(sock, message):
+    """Send a pickled message."""
+    data = pickle.dumps(message, 2)
+    sock.sendall(struct.pack('!I', len(data)) + data)
+
+
+def _recv(sock):
+    """Receive a pickled message."""
+    size, = struct.unpack('!I', _recvall(sock, 4))
+    return pickle.loads(_recvall(sock, size))
+
+
+def _exec(sock, path, args, env, cwd, closefds):
+    """Set up the child process and execute the command."""
+    try:
+        sock.close()
+        if closefds:
+            closefrom(3)
+        if cwd:
+            os.chdir(cwd)
+        os.execve(path, args, env)
+    finally:
+        os._exit(127)
+
+
+def _serve(sock):
+    """Serve requests on `sock` until it is closed.
+
+    A request that fails is answered with the exception, which is raised
+    in the client, and the server continues with the next request.
+    """
+    while True:
+        try:
+            request = _recv(sock)
+        except EOFError:
+            break
+        except Exception as e:
+            # The message was read completely, but could not be unpickled.
+            _reply_exception(sock, e)
+            continue
+        try:
+            command = request[0]
+            if command == 'spawn':
+                pid, master = forkpty(request[6])
+                if pid == 0:
+                    _exec(sock, *request[1:6])
+                _send(sock, ('ok', pid))
+                sendfd(sock, master)
+                os.close(master)
+                continue
+            elif command == 'waitpid':
+                result = os.waitpid(request[1], request[2])
+            else:
+                raise ValueError('Unknown request: %r' % command)
+        except OSError as e:
+            _send(sock, ('error', e.errno, e.strerror))
+        except Exception as e:
+            _reply_exception(sock, e)
+        else:
+            _send(sock, ('ok', result))
+
+
+def _reply_exception(sock, exc):
+    """Send `exc` as the reply to a request that failed."""
+    try:
+        _send(sock, ('exception', exc))
+    except Exception:
+        # The exception cannot be pickled.
+        message = '%s: %s' % (type(exc).__name__, exc)
+        _send(sock, ('exception', ProcessError(message)))
+
+
+class ForkServer(object):
+    """A helper process that starts children on behalf of this process.
+
+    Forking a process with a large heap is expensive, because its page
+    tables need to be copied and every page becomes copy-on-write. A fork
+    server is forked once, preferably early when this process is still
+    small. It then starts children on request, and passes the pty master
+    back over a Unix socket. The children are children of the fork
+    server, so their exit status is also collected by the fork server.
+    """
+
+    def __init__(self):
+        self.pid = None
+        self._sock = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Start the fork server."""
+        if self.pid is not None:
+            return
+        parent, child = socket.socketpair(socket.AF_UNIX, socket.SOCK_STREAM)
+        pid = os.fork()
+        if pid == 0:
+            try:
+                # Do not keep other file descriptors open, including the
+                # sockets of other fork servers.
+                closefrom(3, [child.fileno()])
+                signal.signal(signal.SIGINT, signal.SIG_IGN)
+                _serve(child)
+            finally:
+                os._exit(0)
+        child.close()
+        self.pid = pid
+        self._sock = parent
+
+    def stop(self):
+        """Stop the fork server. The children it started keep running."""
+        if self.pid is None:
+            return
+        self._sock.close()
+        self._sock = None
+        try:
+            os.waitpid(self.pid, 0)
+        except OSError:
+            pass
+        self.pid = None
+
+    def _call(self, *request):
+        """Send a request and return the result."""
+        with self._lock:
+            if self.pid is None:
+                self.start()
+            _send(self._sock, request)
+            response = _recv(self._sock)
+            if response[0] == 'error':
+                raise OSError(response[1], response[2])
+            elif response[0] == 'exception':
+                raise response[1]
+            if request[0] == 'spawn':
+                return response[1], recvfd(self._sock)
+            return response[1]
+
+    def spawn(self, path, args, env, cwd=None, closefds=False,
+              termmodes=None):
+        """Execute `path` on a new pty. Return its pid and the pty master.
+
+        The `termmodes` argument, if provided, is a `TerminalModes` to set
+        on the pty, including its initial window size.
+        """
+        return self._call('spawn', path, list(args), dict(env), cwd,
+                          closefds, termmodes)
+
+    def waitpid(self, pid, options):
+        """Call ``os.waitpid()`` in the fork server."""
+        return self._call('waitpid', pid, options)
+
+
+_server = ForkServer()
+
+def start_server():
+    """Start the default fork server.
+
+    Call this early, while the process is still small. Otherwise the
+    server is started when it is first used.
+    """
+    _server.start()
+
+
+class ForkServerProcess(PosixProcess):
+    """A `PosixProcess` that is started by a fork server.
+
+    The fork server can be passed in as `server`. By default, the default
+    fork server is used. Pass this class as the `process_class` argument to
+    `spawn()` to use it. Its children are reaped by the fork server, so a
+    `Reaper` is not used.
+    """
+
+    reaper = None
+
+    def __init__(self, command, args=None, cwd=None, env=None, closefds=None,
+                 server=None, termmodes=None):
+        PosixProcess.__init__(self, command, args, cwd, env, closefds,
+                              termmodes=termmodes)
+        self.server = server if server is not None else _server
+
+    def _fork(self, path, env):
+        return self.server.spawn(path, self.args, env, self.cwd,
+                                 self.closefds, self.termmodes)
+
+    def _waitpid(self, flags):
+        if flags & os.WNOHANG:
+            return self.server.waitpid(self.pid, flags)
+        # Do not block the fork server, it serves other processes too.
+        delay = 0.001
+        while True:
+            pid, status = self.server.waitpid(self.pid, flags | os.WNOHANG)
+            if pid:
+                return pid, status
+            time.sleep(delay)
+            delay = min(0.1, 2 * delay)
@@ -9,6 +9,7 @@
 from __future__ import absolute_import
 
 from gevent import fd, Timeout
+from gevent.socket import wait_read
 
 from winpexpect import compat
 from winpexpect.nbio import NBIO
@@ -45,6 +46,24 @@ class GEventNBIO(NBIO):
                 timeout.cancel()
         return buf
 
+    def readinto(self, buf):
+        if self.timeout is None:
+            timeout = None
+        else:
+            timeout = Timeout(self.timeout)
+            timeout.start()
+        try:
+            wait_read(self.fd)
+            nbytes = compat.readinto(self.fd, buf)
+        except Timeout as e:
+            if e is not timeout:
+                raise
+            raise TIMEOUT('Timeout reading from fd')
+        else:
+            if timeout is not None:
+                timeout.cancel()
+        return nbytes
+
     def write(self, buf):
         if self.timeout is None:
             timeout = None
@@ -0,0 +1,234 @@
+#
+# This file is part of WinPexpect. WinPexpect is free software that is made
+# available under the MIT license. Consult the file "LICENSE" that is
+# distributed together with this file for the exact licensing terms.
+#
+# WinPexpect is copyright (c) 2010-2012 by the WinPexpect authors. See the
+# file "AUTHORS" for a complete overview.
+
+import errno
+import heapq
+import select
+import itertools
+
+from winpexpect import compat
+from winpexpect.exception import TIMEOUT
+
+
+class _Expect(object):
+    """A pending expect call."""
+
+    def __init__(self, session, pattern, deadline, callback):
+        self.session = session
+        self.pattern = pattern
+        self.deadline = deadline
+        self.callback = callback
+        self.done = False
+
+
+class ExpectGroup(object):
+    """Expect on many sessions from a single thread.
+
+    An expect group waits for the output of all its sessions with a single
+    epoll object (or a poll object where epoll is not available), so that
+    there is no limit on the number of sessions, and the cost of waiting
+    does not depend on it. Timeouts are kept in a heap of deadlines.
+
+    Use `expect()` or `expect_exact()` to start an expect call on a
+    session, and `expect_any()` or `run()` to wait for them to complete.
+    The result of an expect call is the index of the pattern that matched,
+    or the exception that occurred if it was not in the pattern list. A
+    callback can be used to start the next expect call on the session,
+    which allows a state machine to be run per session.
+    """
+
+    def __init__(self):
+        if hasattr(select, 'epoll'):
+            self._poller = select.epoll()
+            self._events = select.EPOLLIN
+            self._scale = 1
+        else:
+            self._poller = select.poll()
+            self._events = select.POLLIN
+            self._scale = 1000
+        self._pending = {}
+        self._deadlines = []
+        self._done = []
+        self._sequence = itertools.count()
+
+    def __len__(self):
+        """Return the number of pending expect calls."""
+        return len(self._pending) + len(self._done)
+
+    def expect(self, session, pattern, timeout=-1, callback=None):
+        """Start searching for `pattern` in the output of `session`.
+
+        The `session` argument must be a spawn object, and `pattern` is
+        like the argument to its ``expect()`` method. A session can have
+        only one pending expect call. The `timeout` defaults to that of the
+        session. If `callback` is provided, it is called with the session
+        and the result as arguments when the expect call completes.
+        """
+        pattern = session._compile(pattern, session.ignorecase)
+        self._add(session, pattern, timeout, callback)
+
+    def expect_exact(self, session, pattern, timeout=-1, callback=None):
+        """Start searching for the literal string `pattern`.
+
+        This is like `expect()` but uses ``expect_exact()`` semantics.
+        """
+        pattern = session._compile_exact(pattern)
+        self._add(session, pattern, timeout, callback)
+
+    def _add(self, session, pattern, timeout, callback):
+        """Add a pending expect call."""
+        fd = session.fileno()
+        if fd in self._pending:
+            raise RuntimeError('Session already has a pending expect')
+        if timeout == -1:
+            timeout = session.timeout
+        if timeout is None:
+            deadline = None
+        else:
+            deadline = compat.monotonic() + timeout
+        expect = _Expect(session, pattern, deadline, callback)
+        # The data that was already read may contain a match.
+        index = session._scan(pattern)
+        if index is not None:
+            expect.done = True
+            self._done.append((expect, index))
+            return
+        self._pending[fd] = expect
+        self._poller.register(fd, self._events)
+        if deadline is not None:
+            heapq.heappush(self._deadlines,
+                           (deadline, next(self._sequence), expect))
+
+    def cancel(self, session):
+        """Cancel the pending expect call of `session`, if any."""
+        expect = self._pending.get(session.fileno())
+        if expect is not None:
+            self._remove(expect)
+        self._done = [(exp, result) for exp,result in self._done
+                      if exp.session is not session]
+
+    def _remove(self, expect):
+        """Remove a pending expect call."""
+        expect.done = True
+        fd = expect.session.fileno()
+        del self._pending[fd]
+        self._poller.unregister(fd)
+
+    def _complete(self, expect, result):
+        """Complete a pending expect call with `result`."""
+        self._remove(expect)
+        self._done.append((expect, result))
+
+    def _process(self, fd):
+        """Process a readable file descriptor."""
+        expect = self._pending.get(fd)
+        if expect is None:
+            return
+        session = expect.session
+        # Read without blocking, so that a spurious wakeup does not stall
+        # the other sessions for the timeout of this one.
+        saved, session.timeout = session.timeout, 0
+        try:
+            try:
+                session._readstep(session.readpolicy, session.maxread,
+                                  session.searchwindowsize)
+            finally:
+                session.timeout = saved
+            index = session._scan(expect.pattern)
+        except TIMEOUT:
+            # Nothing to read after all.
+            return
+        except Exception as e:
+            try:
+                index = session._fail(expect.pattern, e)
+            except Exception as e:
+                index = e
+        if index is not None:
+            self._complete(expect, index)
+
+    def _expire(self, now):
+        """Time out the pending expect calls whose deadline has passed."""
+        deadlines = self._deadlines
+        while deadlines and (deadlines[0][2].done or deadlines[0][0] <= now):
+            deadline, seq, expect = heapq.heappop(deadlines)
+            if expect.done:
+                continue
+            try:
+                result = expect.session._fail(expect.pattern,
+                                              TIMEOUT('Timeout exceeded'))
+            except TIMEOUT as e:
+                result = e
+            self._complete(expect, result)
+
+    def expect_any(self, timeout=None):
+        """Wait until at least one pending expect call has completed.
+
+        The return value is a list of (session, result) tuples for the
+        expect calls that completed. The callbacks of those calls are run
+        before returning. An empty list is returned if nothing completed
+        within `timeout` seconds, or if nothing is pending.
+        """
+        if timeout is not None:
+            endtime = compat.monotonic() + timeout
+        while not self._done and self._pending:
+            now = compat.monotonic()
+            self._expire(now)
+            if self._done:
+                break
+            wait = None
+            if self._deadlines:
+                wait = self._deadlines[0][0] - now
+            if timeout is not None:
+                timeleft = endtime - now
+                if timeleft <= 0:
+                    break
+                wait = timeleft if wait is None else min(wait, timeleft)
+            if wait is None:
+                wait = -1 if self._scale == 1 else None
+            else:
+                wait = max(0, wait) * self._scale
+            try:
+                events = self._poller.poll(wait)
+            except (IOError, OSError, select.error) as e:
+                if e.args[0] != errno.EINTR:
+                    raise
+                continue
+            for fd,event in events:
+                self._process(fd)
+        done, self._done = self._done, []
+        result = []
+        for expect,index in done:
+            result.append((expect.session, index))
+            if expect.callback is not None:
+                expect.callback(expect.session, index)
+        return result
+
+    def run(self, timeout=None):
+        """Run until there are no more pending expect calls.
+
+        Callbacks may start new expect calls. If `timeout` is provided, this
+        returns after `timeout` seconds even if there are pending calls.
+        """
+        if timeout is not None:
+            endtime = compat.monotonic() + timeout
+        while len(self):
+            if timeout is None:
+                self.expect_any()
+            else:
+                timeleft = endtime - compat.monotonic()
+                if timeleft <= 0:
+                    break
+                self.expect_any(timeleft)
+
+    def close(self):
+        """Close the group. Pending expect calls are cancelled."""
+        for expect in list(self._pending.values()):
+            self._remove(expect)
+        self._done = []
+        if hasattr(self._poller, 'close'):
+            self._poller.close()
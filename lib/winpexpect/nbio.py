@@ -35,6 +35,23 @@ class NBIO(object):
         available is less than `size`.
         """
 
+    def readinto(self, buf):
+        """Read up to ``len(buf)`` bytes from the file descriptor into the
+        writable buffer `buf`.
+
+        The return value is the number of bytes read. This behaves like
+        `read()` otherwise. If this is not supported, None is returned.
+        """
+
+    def available(self):
+        """Return the number of bytes that can be read without blocking.
+
+        If this cannot be determined, None is returned.
+        """
+
+    def release(self):
+        """Release the resources that are not needed while idle."""
+
     def write(self, buf):
         """Write `buf` to the file descriptor.
 
@@ -8,9 +8,12 @@
 
 import os
 import os.path
+import re
+import sys
+import math
 import pty
 import time
-import stat
+import codecs
 import fcntl
 import errno
 import select
@@ -22,7 +25,7 @@ import itertools
 from collections import namedtuple
 
 from winpexpect import compat
-from winpexpect.exception import TIMEOUT
+from winpexpect.exception import TIMEOUT, ProcessError
 from winpexpect.process import Process
 from winpexpect.terminal import Terminal
 from winpexpect.nbio import NBIO
@@ -81,6 +84,81 @@ def split_command_line(cmdline):
         raise ValueError('Illegal quoting in command line')
     return result
 
+# Command lines without these characters are a single word.
+_special = re.compile(r'[\s\'"\\]')
+
+
+def _mtime(dirname):
+    """Return the modification time of `dirname`, or None."""
+    try:
+        return os.stat(dirname).st_mtime
+    except OSError:
+        return None
+
+
+class WhichCache(object):
+    """A cache for `which()`.
+
+    Results are cached per command and value of $PATH. A result stays valid
+    as long as the directories that were searched for it are not modified.
+    This is checked with their modification times, at most once every
+    `interval` seconds. Changes that do not modify a directory, like
+    changing the permissions of a file, are not noticed. Use `clear()`
+    after such a change.
+
+    The `hits` and `misses` attributes count the lookups that were and
+    were not answered from the cache.
+    """
+
+    def __init__(self, interval=1.0):
+        self.interval = interval
+        self.hits = 0
+        self.misses = 0
+        self._entries = {}
+
+    def clear(self):
+        """Clear the cache."""
+        self._entries.clear()
+
+    def lookup(self, command, path):
+        """Find the executable `command` in the directories in `path`."""
+        key = (command, path)
+        entry = self._entries.get(key)
+        if entry is not None:
+            result, dirs, mtimes, checked = entry
+            now = compat.monotonic()
+            if now - checked < self.interval:
+                self.hits += 1
+                return result
+            if [_mtime(dirname) for dirname in dirs] == mtimes:
+                entry[3] = now
+                self.hits += 1
+                return result
+        self.misses += 1
+        checked = compat.monotonic()
+        result = None
+        dirs = []
+        mtimes = []
+        for dirname in path.split(os.pathsep):
+            # Get the modification time first, so that a change during the
+            # search is noticed.
+            dirs.append(dirname)
+            mtimes.append(_mtime(dirname))
+            fname = os.path.join(dirname, command)
+            if os.access(fname, os.X_OK):
+                result = fname
+                break
+        # Relative directories depend on the current directory. A directory
+        # that was modified very recently may be modified again without its
+        # modification time changing, because it has limited resolution.
+        recent = time.time() - 2
+        if all(os.path.isabs(dirname) for dirname in dirs) and \
+                all(mtime is None or mtime < recent for mtime in mtimes):
+            self._entries[key] = [result, dirs, mtimes, checked]
+        return result
+
+
+which_cache = WhichCache()
 
 def which(command):
     """Find the executale `command` in $PATH."""
@@ -89,65 +167,228 @@ def which(command):
     elif command.startswith('.'):
         command = os.path.abspath(command)
         return command if os.access(command, os.X_OK) else None
-    path = os.environ.get('PATH')
-    path = path.split(os.pathsep)
-    for base in path:
-        fname = os.path.join(base, command)
-        if os.access(fname, os.X_OK):
-            return fname
-
-
-def closefrom(fd):
-    """Close add file descriptors starting at `fdlow'."""
-    def _close(fd):
-        """Close a file descriptor ignoring errors."""
-        try:
-            os.close(fd)
-        except OSError:
-            pass
-    # Try a Linux optimization first
+    path = os.environ.get('PATH', os.defpath)
+    return which_cache.lookup(command, path)
+
+
+def _get_close_range():
+    """Return the close_range() system call as a function, or None."""
+    if not sys.platform.startswith('linux'):
+        return
+    try:
+        import ctypes
+        libc = ctypes.CDLL(None, use_errno=True)
+    except (ImportError, OSError):
+        return
+    close_range = getattr(libc, 'close_range', None)
+    if close_range is None:
+        # Older C libraries do not have a wrapper. The system call number
+        # is the same on all architectures.
+        syscall = libc.syscall
+        close_range = lambda first, last, flags: \
+                syscall(436, first, last, flags)
+    def _close_range(first, last):
+        if close_range(ctypes.c_uint(first), ctypes.c_uint(last), 0) != 0:
+            raise OSError(ctypes.get_errno(), 'close_range() failed')
+    # Check that the kernel supports it (Linux 5.9 and later).
     try:
-        st = os.stat('/proc/self/fd')
+        _close_range(2**31 - 1, 2**31 - 1)
     except OSError:
-        st = None
-    if st and stat.S_ISDIR(st.st_mode):
-        fds = map(int, os.listdir('/proc/self/fd'))
+        return
+    return _close_range
+
+_close_range = _get_close_range()
+
+
+def _get_pidfd_open():
+    """Return the pidfd_open() system call as a function, or None."""
+    if hasattr(os, 'pidfd_open'):
+        return os.pidfd_open
+    if not sys.platform.startswith('linux'):
+        return
+    try:
+        import ctypes
+        libc = ctypes.CDLL(None, use_errno=True)
+    except (ImportError, OSError):
+        return
+    def pidfd_open(pid):
+        # The system call number is the same on all architectures.
+        fd = libc.syscall(434, pid, 0)
+        if fd < 0:
+            raise OSError(ctypes.get_errno(), 'pidfd_open() failed')
+        fcntl.fcntl(fd, fcntl.F_SETFD, fcntl.FD_CLOEXEC)
+        return fd
+    return pidfd_open
+
+_pidfd_open = _get_pidfd_open()
+
+
+def closefrom(fd, keep=()):
+    """Close all file descriptors starting at `fd`, except those in `keep`.
+
+    This uses the close_range() system call where available. Otherwise the
+    open file descriptors are listed in /proc/self/fd, and if that is not
+    available either, os.closerange() is used up to the file descriptor
+    limit.
+    """
+    keep = sorted(set([kfd for kfd in keep if kfd >= fd]))
+    if _close_range is not None:
+        for kfd in keep:
+            if kfd > fd:
+                _close_range(fd, kfd - 1)
+            fd = kfd + 1
+        _close_range(fd, 2**32 - 1)
+        return
+    try:
+        fds = [int(fd1) for fd1 in os.listdir('/proc/self/fd')]
+    except OSError:
+        fds = None
+    if fds is not None:
         for fd1 in fds:
-            if fd1 >= fd:
-                _close(fd1)
+            if fd1 >= fd and fd1 not in keep:
+                try:
+                    os.close(fd1)
+                except OSError:
+                    pass
         return
-    # This should work on most Unixes
-    maxfd = os.sysconf("SC_OPEN_MAX")
-    for fd1 in range(fd, maxfd):
-        _close(fd1)
+    for kfd in keep:
+        os.closerange(fd, kfd)
+        fd = kfd + 1
+    os.closerange(fd, os.sysconf('SC_OPEN_MAX'))
+
+
+class TerminalModes(object):
+    """Terminal modes to set on a new pty.
+
+    If `echo` is provided, echo is turned on or off. If `raw` is set, the
+    terminal is put in raw mode, like ``cfmakeraw()`` does. If `onlcr` is
+    provided, the translation of NL to CR-NL on output is turned on or off.
+    If `winsize` is provided, it is a (rows, cols) tuple with the window
+    size.
+    """
+
+    def __init__(self, echo=None, raw=False, onlcr=None, winsize=None):
+        self.echo = echo
+        self.raw = raw
+        self.onlcr = onlcr
+        self.winsize = winsize
+
+    def apply(self, fd):
+        """Apply the modes to the terminal `fd`."""
+        attrs = termios.tcgetattr(fd)
+        if self.raw:
+            attrs[0] &= ~(termios.IGNBRK | termios.BRKINT | termios.PARMRK |
+                          termios.ISTRIP | termios.INLCR | termios.IGNCR |
+                          termios.ICRNL | termios.IXON)
+            attrs[1] &= ~termios.OPOST
+            attrs[2] &= ~(termios.CSIZE | termios.PARENB)
+            attrs[2] |= termios.CS8
+            attrs[3] &= ~(termios.ECHO | termios.ECHONL | termios.ICANON |
+                          termios.ISIG | termios.IEXTEN)
+            attrs[6][termios.VMIN] = 1
+            attrs[6][termios.VTIME] = 0
+        if self.echo is not None:
+            if self.echo:
+                attrs[3] |= termios.ECHO
+            else:
+                attrs[3] &= ~termios.ECHO
+        if self.onlcr is not None:
+            if self.onlcr:
+                attrs[1] |= termios.ONLCR
+            else:
+                attrs[1] &= ~termios.ONLCR
+        termios.tcsetattr(fd, termios.TCSANOW, attrs)
+        if self.winsize:
+            packed = struct.pack('@HHHH', self.winsize[0], self.winsize[1],
+                                 0, 0)
+            fcntl.ioctl(fd, termios.TIOCSWINSZ, packed)
+
+
+def forkpty(termmodes=None):
+    """Like ``os.forkpty()``, but set the `TerminalModes` `termmodes` on
+    the pty before the child is forked.
+
+    The modes are then in effect before the child runs, and also when this
+    returns in the parent.
+    """
+    if termmodes is None:
+        return os.forkpty()
+    master, slave = os.openpty()
+    try:
+        termmodes.apply(slave)
+        pid = os.fork()
+    except:
+        os.close(master)
+        os.close(slave)
+        raise
+    if pid == 0:
+        try:
+            os.close(master)
+            # Make the pty the controlling terminal of a new session.
+            os.setsid()
+            fcntl.ioctl(slave, termios.TIOCSCTTY, 0)
+            for fd in (0, 1, 2):
+                os.dup2(slave, fd)
+            if slave > 2:
+                os.close(slave)
+        except:
+            os._exit(127)
+        return pid, -1
+    os.close(slave)
+    return pid, master
 
 
 class PosixProcess(Process):
-    """POSIX version of Process."""
+    """POSIX version of Process.
+
+    If `reaper` is set to a `Reaper`, processes are reaped by it, and
+    ``isalive()`` looks up the exit status in its table.
+    """
+
+    reaper = None
 
-    def __init__(self, command, args=None, cwd=None, env=None, closefds=None):
-        """Constructor."""
+    def __init__(self, command, args=None, cwd=None, env=None, closefds=None,
+                 keepfds=None, termmodes=None):
+        """Constructor.
+
+        The `command` argument may also be a list with a command line that
+        was already parsed. It is then used as is, and `args` is ignored.
+
+        If `closefds` is set, all file descriptors other than stdin, stdout
+        and stderr are closed in the child, except those in `keepfds`.
+        """
         self._parse_args(command, args)
         self.cwd = cwd
         self.env = env
         self.closefds = closefds
+        self.keepfds = keepfds or ()
+        self.termmodes = termmodes
         self.pid = None
+        self.pidfd = None
         self.ptyfd = None
+        self._reaper = None
         self.encoding = None
         self.exitstatus = None
         self.termsig = None
+        self._readdecoder = None
 
     def _parse_args(self, command, args):
         """Parse the command line and arguments."""
-        if args:
+        if isinstance(command, list):
+            args = list(command)
+            command = args[0]
+        elif args:
             args.insert(0, command)
+        elif _special.search(command) is None:
+            args = [command]
         else:
             args = split_command_line(command)
             command = args[0]
         self.command = command
         self.args = args
 
-    def _get_encoding(self, env):
+    @staticmethod
+    def _get_encoding(env):
         """Try to determine the encoding."""
         try:
             locale, encoding = env['LANG'].split('.')
@@ -161,24 +402,60 @@ class PosixProcess(Process):
             return
         path = which(self.command)
         if path is None:
-            raise ProcessError('Could not find %s in $PATH' % command)
+            raise ProcessError('Could not find %s in $PATH' % self.command)
         env = self.env
         if env is None:
             env = os.environ
-        encoding = self._get_encoding(env)
-        pid, master = os.forkpty()
-        if pid == 0:
-            if self.closefds:
-                closefrom(3)
-            if self.cwd:
-                os.chdir(self.cwd)
-            os.execve(path, self.args, env)
+        self._start(path, env, self._get_encoding(env))
+
+    def _start(self, path, env, encoding):
+        """Start the child, with the path of the executable, the environment
+        and the encoding already resolved."""
+        pid, master = self._fork(path, env)
         self.pid = pid
+        # A pidfd becomes readable when the process exits. It is used to
+        # wait for the child and can be registered with an event loop.
+        self.pidfd = None
+        if _pidfd_open is not None:
+            try:
+                self.pidfd = _pidfd_open(pid)
+            except OSError:
+                pass
+        self._reaper = self.reaper
+        if self._reaper is not None:
+            self._reaper.watch(pid, self.pidfd)
         self.ptyfd = master
         self.encoding = encoding
+        if encoding:
+            self._readdecoder = codecs.getincrementaldecoder(encoding)()
+        else:
+            self._readdecoder = None
         self.termsig = None
         self.exitstatus = None
 
+    def _fork(self, path, env):
+        """Start the child on a new pty. Return its pid and the pty master."""
+        pid, master = forkpty(self.termmodes)
+        if pid == 0:
+            try:
+                if self.closefds:
+                    closefrom(3, self.keepfds)
+                for fd in self.keepfds:
+                    if hasattr(os, 'set_inheritable'):
+                        os.set_inheritable(fd, True)
+                if self.cwd:
+                    os.chdir(self.cwd)
+                os.execve(path, self.args, env)
+            finally:
+                os._exit(127)
+        return pid, master
+
+    def _waitpid(self, flags):
+        """Call waitpid() for the child."""
+        if self._reaper is not None:
+            return self._reaper.waitpid(self.pid, flags)
+        return os.waitpid(self.pid, flags)
+
     def fileno(self):
         if self.ptyfd is None:
             raise RuntimeError('You need to call start() first')
@@ -188,15 +465,21 @@ class PosixProcess(Process):
         if self.ptyfd is None:
             raise RuntimeError('You need to call start() first')
         buf = os.read(self.ptyfd, size)
-        if self.encoding:
-            buf = buf.decode(self.encoding)
-        return buf
+        if self._readdecoder is None:
+            return buf
+        # A multibyte character may be split over multiple reads. The
+        # decoder keeps the partial character until it is complete.
+        while True:
+            text = self._readdecoder.decode(buf, not buf)
+            if text or not buf:
+                return text
+            buf = os.read(self.ptyfd, size)
 
     def write(self, buf):
         if self.ptyfd is None:
             raise RuntimeError('You need to call start() first.')
         if isinstance(buf, compat.unicode):
-            buf = buf.encode(self.encoding)
+            buf = buf.encode(self.encoding or 'ascii')
         nbytes = os.write(self.ptyfd, buf)
         return nbytes
 
@@ -218,13 +501,15 @@ class PosixProcess(Process):
         if self.pid is None:
             raise RuntimeError('You need to call start() first.')
         if timeout is not None:
-            endtime = time.time() + timeout
+            endtime = compat.monotonic() + timeout
+        if timeout is not None or self.pidfd is not None \
+                or self._reaper is not None:
             flags = os.WNOHANG
         else:
             flags = 0
         while True:
             try:
-                pid, status = os.waitpid(self.pid, flags)
+                pid, status = self._waitpid(flags)
             except OSError as e:
                 if e.errno == errno.EINTR:
                     continue
@@ -236,34 +521,67 @@ class PosixProcess(Process):
                     raise
             if pid > 0:
                 break
-            assert timeout is not None
-            timeleft = endtime - time.time()
-            if timeleft <= 0:
-                break
-            # Sleep anywhere between 0.1 and 1 second depending on the timeout.
-            # This is not ideal because we may know that a child has exited
-            # only 1 seconds after it has happened. The alternative is
-            # installing a signal handler via SIGCHLD which is even less ideal
-            # because it affects how this module can be used together with
-            # other libraries that also need to capture SIGCHLD.
+            if timeout is None:
+                timeleft = None
+            else:
+                timeleft = endtime - compat.monotonic()
+                if timeleft <= 0:
+                    break
+            if self._reaper is not None and \
+                        self._reaper.wait(self.pid, timeleft):
+                continue
+            elif self.pidfd is not None:
+                self._waitpidfd(timeleft)
+                continue
+            elif timeout is None:
+                # The reaper was stopped and there is no pidfd. Block in
+                # waitpid() instead.
+                flags = 0
+                continue
+            # Without a pidfd, sleep anywhere between 0.1 and 1 second
+            # depending on the timeout. This is not ideal because we may
+            # know that a child has exited only 1 seconds after it has
+            # happened. The alternative is installing a signal handler via
+            # SIGCHLD which is even less ideal because it affects how this
+            # module can be used together with other libraries that also
+            # need to capture SIGCHLD.
             time.sleep(max(0.1, min(1, timeout/10.0)))
-        if self.pid == 0:
+        if pid == 0:
             return False
         assert pid == self.pid
-        self.pid = None
+        self._reaped()
         if status is not None:
             self.termsig = os.WTERMSIG(status) if os.WIFSIGNALED(status) else None
             self.exitstatus = os.WEXITSTATUS(status) if os.WIFEXITED(status) else None
         self.close()
         return status is not None
 
+    def _waitpidfd(self, timeout):
+        """Wait until the pidfd is readable or `timeout` seconds passed."""
+        poller = select.poll()
+        poller.register(self.pidfd, select.POLLIN)
+        if timeout is not None:
+            timeout = int(math.ceil(timeout * 1000))
+        try:
+            poller.poll(timeout)
+        except (select.error, OSError) as e:
+            if e.args[0] != errno.EINTR:
+                raise
+
+    def _reaped(self):
+        """Forget the child after it was reaped."""
+        self.pid = None
+        if self.pidfd is not None:
+            os.close(self.pidfd)
+            self.pidfd = None
+
     def isalive(self):
         """Return whether or not the process is alive."""
         if self.pid is None:
             return False
         while True:
             try:
-                pid, status = os.waitpid(self.pid, os.WNOHANG)
+                pid, status = self._waitpid(os.WNOHANG)
             except OSError as e:
                 if e.errno == errno.EINTR:
                     continue
@@ -276,7 +594,7 @@ class PosixProcess(Process):
         if pid == 0:
             return True
         assert pid == self.pid
-        self.pid = None
+        self._reaped()
         if status is not None:
             self.termsig = os.WTERMSIG(status) if os.WIFSIGNALED(status) else None
             self.exitstatus = os.WEXITSTATUS(status) if os.WIFEXITED(status) else None
@@ -304,25 +622,163 @@ class PosixProcess(Process):
         return not self.isalive()
 
 
+def _wait_all(processes, timeout):
+    """Wait until all `processes` have exited, or `timeout` seconds have
+    passed. Return the processes that are still alive."""
+    if timeout is not None:
+        endtime = compat.monotonic() + timeout
+    delay = 0.001
+    while True:
+        processes = [process for process in processes if process.isalive()]
+        if not processes:
+            return processes
+        if timeout is None:
+            timeleft = None
+        else:
+            timeleft = endtime - compat.monotonic()
+            if timeleft <= 0:
+                return processes
+        pidfds = [process.pidfd for process in processes]
+        if None in pidfds:
+            time.sleep(delay if timeleft is None else min(delay, timeleft))
+            delay = min(0.1, 2 * delay)
+            continue
+        # Wake up as soon as any of the processes exits.
+        poller = select.poll()
+        for pidfd in pidfds:
+            poller.register(pidfd, select.POLLIN)
+        if timeleft is not None:
+            timeleft = int(math.ceil(timeleft * 1000))
+        try:
+            poller.poll(timeleft)
+        except (select.error, OSError) as e:
+            if e.args[0] != errno.EINTR:
+                raise
+
+
+def terminate_all(processes, timeout=None):
+    """Terminate all `processes` at once.
+
+    This is like calling ``terminate()`` on each process, but the signals
+    are sent to all processes at the same time and they share a single
+    deadline. All processes get SIGTERM. The processes that have not
+    exited after half of `timeout` get SIGKILL.
+
+    The return value is a list with for each process whether or not it
+    was terminated. The `termsig` attribute tells which signal it took.
+    """
+    processes = list(processes)
+    if timeout is not None:
+        timeout /= 2.0
+    for signo in (signal.SIGTERM, signal.SIGKILL):
+        alive = [process for process in processes if process.pid is not None]
+        for process in alive:
+            try:
+                process.kill(signo)
+            except OSError as e:
+                if e.errno != errno.ESRCH:
+                    raise
+        if not _wait_all(alive, timeout):
+            break
+    return [not process.isalive() for process in processes]
+
+
+class PosixSpawnProcess(PosixProcess):
+    """A `PosixProcess` that is started with ``os.posix_spawn()``.
+
+    After ``os.forkpty()``, the child runs Python code until it calls
+    ``execve()``, which is slow and not safe if the parent has threads.
+    This class opens a pty and lets ``posix_spawn()`` start the child in a
+    new session with the pty as its controlling terminal, so that no
+    Python code runs in the child. If ``posix_spawn()`` is not available
+    or a `cwd` is given, which it does not support, ``os.forkpty()`` is
+    used. The file descriptors in `keepfds` are made inheritable while the
+    child is started.
+    """
+
+    def _fork(self, path, env):
+        if not hasattr(os, 'posix_spawn') or self.cwd:
+            return PosixProcess._fork(self, path, env)
+        restore = [fd for fd in self.keepfds if not os.get_inheritable(fd)]
+        try:
+            for fd in restore:
+                os.set_inheritable(fd, True)
+            return self._spawn(path, env)
+        finally:
+            for fd in restore:
+                os.set_inheritable(fd, False)
+
+    def _spawn(self, path, env):
+        """Start the child with ``posix_spawn()``."""
+        master, slave = os.openpty()
+        try:
+            if self.termmodes is not None:
+                self.termmodes.apply(slave)
+            # Opening the slave in the new session makes it the
+            # controlling terminal.
+            actions = [(os.POSIX_SPAWN_OPEN, 0, os.ttyname(slave),
+                        os.O_RDWR, 0),
+                       (os.POSIX_SPAWN_DUP2, 0, 1),
+                       (os.POSIX_SPAWN_DUP2, 0, 2)]
+            if self.closefds:
+                # Only inheritable file descriptors are passed on.
+                try:
+                    fds = [int(fd) for fd in os.listdir('/proc/self/fd')]
+                except OSError:
+                    fds = range(3, os.sysconf('SC_OPEN_MAX'))
+                for fd in fds:
+                    if fd in self.keepfds:
+                        continue
+                    try:
+                        if fd > 2 and os.get_inheritable(fd):
+                            actions.append((os.POSIX_SPAWN_CLOSE, fd))
+                    except OSError:
+                        pass
+            pid = os.posix_spawn(path, self.args, env, file_actions=actions,
+                                 setsid=True)
+        except:
+            os.close(master)
+            raise
+        finally:
+            os.close(slave)
+        return pid, master
+
+
 class PosixTerminal(Terminal):
-    """A terminal for Posix style systems."""
+    """A terminal for Posix style systems.
+
+    The terminal attributes are read once and kept, and are updated when
+    they are changed through this object. Changes made by the child are
+    not noticed until `refresh()` is called.
+    """
 
     def __init__(self, fd):
         self.ttyfd = fd
+        self._attrs = None
+
+    def _getattrs(self):
+        """Return the terminal attributes."""
+        if self._attrs is None:
+            self._attrs = termios.tcgetattr(self.ttyfd)
+        return self._attrs
+
+    def refresh(self):
+        """Read the terminal attributes again when they are next needed."""
+        self._attrs = None
 
     def getecho(self):
         """Return the echo mode."""
-        attrs = termios.tcgetattr(self.ttyfd)
-        return bool(attrs[3] & termios.ECHO)
+        return bool(self._getattrs()[3] & termios.ECHO)
 
     def setecho(self, echo):
         """Set the echo mode."""
-        attrs = termios.tcgetattr(self.ttyfd)
+        attrs = list(self._getattrs())
         if echo:
             attrs[3] |= termios.ECHO
         else:
             attrs[3] &= ~termios.ECHO
         termios.tcsetattr(self.ttyfd, termios.TCSANOW, attrs)
+        self._attrs = attrs
 
     def getwinsize(self):
         """Return the window size as a (rows, cols) tuple."""
@@ -342,8 +798,7 @@ class PosixTerminal(Terminal):
         index = getattr(termios, name, None)
         if index is None:
             raise ValueError('No such control character: %s' % name)
-        attr = termios.tcgetattr(self.ttyfd)
-        cc = attr[6][index]
+        cc = self._getattrs()[6][index]
         return cc
 
 
@@ -351,11 +806,18 @@ class PosixNBIO(NBIO):
     """Posix Non-Blocking I/O.
 
     If a timeout is set to something else that None, the file descriptor will
-    be put in non-blocking mode. Timeouts > 0 are are implemented with select().
+    be put in non-blocking mode. Timeouts > 0 are are implemented with poll(),
+    which unlike select() works for file descriptors above FD_SETSIZE. The
+    file descriptor is registered once with a poll object for reading and
+    one for writing. On systems without a poll() that works on terminals,
+    select() is used.
     """
 
+    use_poll = hasattr(select, 'poll') and sys.platform != 'darwin'
+
     def __init__(self, fd, timeout=None):
         self.fd = fd
+        self._pollers = {}
         self.settimeout(timeout)
 
     def settimeout(self, timeout):
@@ -368,11 +830,18 @@ class PosixNBIO(NBIO):
         fcntl.fcntl(self.fd, fcntl.F_SETFL, flags)
 
     def read(self, nbytes):
+        return self._retry(os.read, nbytes)
+
+    def readinto(self, buf):
+        return self._retry(compat.readinto, buf)
+
+    def _retry(self, func, arg):
+        """Call ``func(fd, arg)`` until it returns data or times out."""
         if self.timeout is not None:
-            endtime = time.time() + self.timeout
+            endtime = compat.monotonic() + self.timeout
         while True:
             try:
-                buf = os.read(self.fd, nbytes)
+                buf = func(self.fd, arg)
             except OSError as e:
                 if e.errno == errno.EINTR:
                     continue
@@ -380,23 +849,60 @@ class PosixNBIO(NBIO):
                     buf = None
                 else:
                     raise
-            if self.timeout is None or buf:
+            if buf is not None and (self.timeout is None or buf):
                 break
-            timeleft = endtime - time.time()
-            if timeleft < 0:
-                raise TIMEOUT('Timeout reading from fd')
+            if self.timeout is None:
+                timeleft = None
+            else:
+                timeleft = endtime - compat.monotonic()
+                if timeleft < 0:
+                    raise TIMEOUT('Timeout reading from fd')
+            self._wait(False, timeleft)
+        return buf
+
+    def _wait(self, write, timeout):
+        """Wait until the file descriptor is readable, or writable if
+        `write` is set. The wait is cut short by a timeout or a signal."""
+        if not self.use_poll:
+            fds = [self.fd]
             try:
-                select.select([self.fd], [], [], timeleft)
-            except select.error as e:
-                if e[0] != errno.EINTR:
+                if write:
+                    select.select([], fds, [], timeout)
+                else:
+                    select.select(fds, [], [], timeout)
+            except (select.error, OSError) as e:
+                if e.args[0] != errno.EINTR:
                     raise
-        return buf
+            return
+        poller = self._pollers.get(write)
+        if poller is None:
+            poller = select.poll()
+            poller.register(self.fd, select.POLLOUT if write else select.POLLIN)
+            self._pollers[write] = poller
+        if timeout is not None:
+            # Round up so that we do not wake up just before the deadline.
+            timeout = int(math.ceil(timeout * 1000))
+        try:
+            poller.poll(timeout)
+        except (select.error, OSError) as e:
+            if e.args[0] != errno.EINTR:
+                raise
+
+    def release(self):
+        self._pollers.clear()
+
+    def available(self):
+        try:
+            packed = fcntl.ioctl(self.fd, termios.FIONREAD, b'xxxx')
+        except (IOError, OSError):
+            return
+        return struct.unpack('@i', packed)[0]
 
     def write(self, buf):
         if not isinstance(buf, bytes):
             raise TypeError('Expecting raw bytes not unicode')
         if self.timeout is not None:
-            endtime = time.time() + self.timeout
+            endtime = compat.monotonic() + self.timeout
         byteswritten = 0
         buf = compat.buffer(buf)
         while True:
@@ -414,12 +920,8 @@ class PosixNBIO(NBIO):
             if self.timeout is None:
                 timeleft = None
             else:
-                timeleft = endtime - time.time()
+                timeleft = endtime - compat.monotonic()
                 if timeleft < 0:
                     raise TIMEOUT('Timeout writing to fd')
-            try:
-                select.select([], [self.fd], [], timeleft)
-            except select.error as e:
-                if e[0] != errno.EINTR:
-                    raise
+            self._wait(True, timeleft)
         return byteswritten
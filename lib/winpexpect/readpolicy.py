@@ -0,0 +1,74 @@
+#
+# This file is part of WinPexpect. WinPexpect is free software that is made
+# available under the MIT license. Consult the file "LICENSE" that is
+# distributed together with this file for the exact licensing terms.
+#
+# WinPexpect is copyright (c) 2010-2012 by the WinPexpect authors. See the
+# file "AUTHORS" for a complete overview.
+
+
+class ReadPolicy(object):
+    """Read policy.
+
+    A read policy decides how many bytes a `Searcher` reads at a time. A
+    policy may keep state, so every searcher needs its own instance.
+    """
+
+    __slots__ = ()
+
+    def size(self, available):
+        """Return the number of bytes to read next.
+
+        The `available` argument is a function that returns the number of
+        bytes that can be read without blocking, or None if this is not
+        known. Calling it may cost a system call.
+        """
+
+    def update(self, size, nbytes):
+        """Called after a read of `size` bytes returned `nbytes` bytes."""
+
+
+class FixedReadPolicy(ReadPolicy):
+    """Always read the same number of bytes."""
+
+    __slots__ = ('maxread',)
+
+    def __init__(self, maxread=2000):
+        self.maxread = maxread
+
+    def size(self, available):
+        return self.maxread
+
+    def update(self, size, nbytes):
+        pass
+
+
+class AdaptiveReadPolicy(ReadPolicy):
+    """Adapt the read size to the amount of output.
+
+    The read size starts at `minread`. When a read fills the buffer, there
+    is probably more data, and the next read is sized to the number of
+    bytes that are available, up to `maxread`. When reads return a lot
+    less than was asked for, the read size shrinks back to `minread`.
+    """
+
+    __slots__ = ('minread', 'maxread', 'current', 'full')
+
+    def __init__(self, minread=200, maxread=65536):
+        self.minread = minread
+        self.maxread = maxread
+        self.current = minread
+        self.full = False
+
+    def size(self, available):
+        if self.full:
+            nbytes = available()
+            if nbytes is None:
+                nbytes = 2 * self.current
+            self.current = max(self.minread, min(self.maxread, nbytes))
+        return self.current
+
+    def update(self, size, nbytes):
+        self.full = nbytes >= size
+        if nbytes < size // 4:
+            self.current = max(self.minread, size // 2)
@@ -0,0 +1,186 @@
+#
+# This file is part of WinPexpect. WinPexpect is free software that is made
+# available under the MIT license. Consult the file "LICENSE" that is
+# distributed together with this file for the exact licensing terms.
+#
+# WinPexpect is copyright (c) 2010-2012 by the WinPexpect authors. See the
+# file "AUTHORS" for a complete overview.
+
+import os
+import fcntl
+import errno
+import select
+import threading
+
+from winpexpect import compat
+from winpexpect.posix import PosixProcess
+
+
+class Reaper(object):
+    """Reap child processes in a background thread.
+
+    The reaper waits for the processes it watches and keeps their exit
+    status in a table until it is collected with `waitpid()`. Checking
+    whether a process is alive then does not need a system call, and the
+    exit status cannot get lost.
+
+    The thread waits on the pidfds of the processes. Processes without a
+    pidfd are polled every `interval` seconds.
+    """
+
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self._status = {}
+        self._pids = set()
+        self._pidfds = {}
+        self._added = []
+        self._cond = threading.Condition()
+        self._thread = None
+        self._wakeup = None
+
+    def start(self):
+        """Start the reaper thread."""
+        if self._thread is not None:
+            return
+        self._wakeup = os.pipe()
+        for fd in self._wakeup:
+            fcntl.fcntl(fd, fcntl.F_SETFD, fcntl.FD_CLOEXEC)
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """Stop the reaper thread.
+
+        Processes that are still watched are reaped by `waitpid()` itself
+        after this.
+        """
+        thread = self._thread
+        if thread is None:
+            return
+        self._thread = None
+        os.write(self._wakeup[1], b'x')
+        thread.join()
+        with self._cond:
+            # Wake up wait(), which cannot rely on the thread any more.
+            self._cond.notify_all()
+        for fd in self._wakeup:
+            os.close(fd)
+        for fd in self._pidfds:
+            os.close(fd)
+        self._pidfds = {}
+        for pid, pidfd in self._added:
+            if pidfd is not None:
+                os.close(pidfd)
+        del self._added[:]
+        self._wakeup = None
+
+    def watch(self, pid, pidfd=None):
+        """Start watching the child `pid`, with pidfd `pidfd` if any."""
+        if pidfd is not None:
+            pidfd = os.dup(pidfd)
+            fcntl.fcntl(pidfd, fcntl.F_SETFD, fcntl.FD_CLOEXEC)
+        with self._cond:
+            self._pids.add(pid)
+            self._added.append((pid, pidfd))
+        if self._thread is not None:
+            os.write(self._wakeup[1], b'x')
+
+    def _reap(self, pid):
+        """Reap `pid` if it has exited. Must be called with the lock held."""
+        try:
+            rpid, status = os.waitpid(pid, os.WNOHANG)
+        except OSError as e:
+            if e.errno != errno.ECHILD:
+                raise
+            # Someone else reaped it. The exit status is lost.
+            rpid, status = pid, None
+        if rpid == 0:
+            return False
+        self._pids.discard(pid)
+        self._status[pid] = status
+        self._cond.notify_all()
+        return True
+
+    def _run(self):
+        """The reaper thread."""
+        poller = select.poll()
+        poller.register(self._wakeup[0], select.POLLIN)
+        polled = set()
+        while self._thread is not None:
+            with self._cond:
+                for pid, pidfd in self._added:
+                    if pidfd is None:
+                        polled.add(pid)
+                    else:
+                        self._pidfds[pidfd] = pid
+                        poller.register(pidfd, select.POLLIN)
+                del self._added[:]
+                for pid in list(polled):
+                    if self._reap(pid):
+                        polled.discard(pid)
+            timeout = int(self.interval * 1000) if polled else None
+            try:
+                events = poller.poll(timeout)
+            except (select.error, OSError) as e:
+                if e.args[0] != errno.EINTR:
+                    raise
+                continue
+            for fd, event in events:
+                if fd == self._wakeup[0]:
+                    os.read(fd, 512)
+                    continue
+                with self._cond:
+                    pid = self._pidfds.pop(fd)
+                    poller.unregister(fd)
+                    os.close(fd)
+                    if not self._reap(pid):
+                        polled.add(pid)
+
+    def waitpid(self, pid, flags):
+        """Like ``os.waitpid()``, but take the status from the table."""
+        with self._cond:
+            while True:
+                if pid in self._status:
+                    return pid, self._status.pop(pid)
+                if pid not in self._pids:
+                    break
+                if self._thread is None and self._reap(pid):
+                    continue
+                if flags & os.WNOHANG:
+                    return 0, 0
+                if self._thread is None:
+                    break
+                self._cond.wait()
+        return os.waitpid(pid, flags)
+
+    def wait(self, pid, timeout=None):
+        """Wait until `pid` has exited or `timeout` seconds have passed.
+
+        Return False if the reaper thread is not running. Nothing reaps
+        `pid` then, and the caller needs to wait for it in another way.
+        """
+        if timeout is not None:
+            endtime = compat.monotonic() + timeout
+        with self._cond:
+            while pid in self._pids and self._thread is not None:
+                if timeout is None:
+                    self._cond.wait()
+                    continue
+                timeleft = endtime - compat.monotonic()
+                if timeleft <= 0:
+                    break
+                self._cond.wait(timeleft)
+            return self._thread is not None
+
+
+def start_reaper(interval=0.05):
+    """Start a reaper for all `PosixProcess` instances started after this.
+
+    Return the `Reaper`.
+    """
+    if PosixProcess.reaper is None:
+        reaper = Reaper(interval)
+        reaper.start()
+        PosixProcess.reaper = reaper
+    return PosixProcess.reaper
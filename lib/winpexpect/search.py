@@ -8,19 +8,333 @@
 
 import os
 import re
+import errno
+import codecs
+import threading
+
+from collections import OrderedDict
+
+try:
+    from re import _parser as sre_parse
+except ImportError:
+    import sre_parse
 
 from winpexpect import compat
+from winpexpect.automaton import Automaton
+from winpexpect.buffer import Buffer, extract
 from winpexpect.exception import EOF
 
 
+# Matches that may be longer than this are considered unbounded for the
+# purpose of incremental scanning.
+MAXOVERLAP = 65536
+
+def _walk(tree):
+    """Yield all (op, arg) tuples in a parsed regular expression."""
+    for op,av in tree:
+        yield op, av
+        stack = [av]
+        while stack:
+            av = stack.pop()
+            if isinstance(av, sre_parse.SubPattern):
+                for item in _walk(av):
+                    yield item
+            elif isinstance(av, (tuple, list)):
+                stack.extend(av)
+
+def max_match_length(pattern, flags=0):
+    """Return the maximum length of a match of `pattern`, or None if the
+    length is unbounded.
+
+    Patterns that contain lookahead assertions or back references are
+    considered unbounded as well, because whether they match depends on
+    data outside the match itself.
+    """
+    return _max_match_length(sre_parse.parse(pattern, flags))
+
+def _max_match_length(tree):
+    for op,av in _walk(tree):
+        if op in (sre_parse.ASSERT, sre_parse.ASSERT_NOT) and av[0] == 1:
+            return None
+        elif op in (sre_parse.GROUPREF, sre_parse.GROUPREF_EXISTS):
+            return None
+    width = tree.getwidth()[1]
+    if width > MAXOVERLAP:
+        return None
+    return width
+
+def looks_behind(pattern, flags=0):
+    """Return whether a match of `pattern` depends on the data before it.
+
+    This is the case for patterns that contain lookbehind assertions, or
+    anchors like "^" and "\\b" that look at the previous character.
+    """
+    return _looks_behind(sre_parse.parse(pattern, flags))
+
+def _looks_behind(tree):
+    for op,av in _walk(tree):
+        if op in (sre_parse.ASSERT, sre_parse.ASSERT_NOT) and av[0] == -1:
+            return True
+        elif op == sre_parse.AT and av not in (sre_parse.AT_END,
+                    sre_parse.AT_END_LINE, sre_parse.AT_END_STRING):
+            return True
+    return False
+
+
+class PatternSet(object):
+    """A compiled list of patterns.
+
+    A pattern set can be passed to `Searcher.search()` instead of a pattern
+    list. Compiling the patterns up front means that no work needs to be
+    done to set up the search, which matters when the same patterns are
+    searched for many times.
+
+    The patterns are combined into a single regular expression in which
+    each pattern is wrapped in a group. Named groups in the patterns can
+    be accessed on the match object as usual. Numbered groups are shifted
+    by the groups that come before them, use `groups()` to get the groups
+    of the pattern that matched. Numbered back references refer to the
+    wrong group because of this, even in the first pattern. Use a named
+    group and ``(?P=name)`` instead.
+    """
+
+    def __init__(self, patterns, ignorecase=False, maxlen=None):
+        """Constructor.
+
+        The `patterns` argument must be a string, an exception, or a list
+        of strings and exceptions. If `ignorecase` is set, the regular
+        expressions are matched case insensitively.
+
+        The `maxlen` argument is a hint that specifies the maximum length
+        of a match. If it is not provided it is derived from the patterns
+        if possible. Knowing the maximum length allows the searcher to
+        only rescan the tail of its buffer when new data arrives.
+        """
+        if not isinstance(patterns, list):
+            patterns = [patterns]
+        regexes = []
+        exceptions = []
+        flags = re.DOTALL
+        if ignorecase:
+            flags |= re.IGNORECASE
+        # Map the index of the group that wraps each pattern to the index of
+        # the pattern. The wrapping group is the last one that closes when
+        # the pattern matches, so it is the match's "lastindex".
+        groupindex = [None]
+        for ix,pattern in enumerate(patterns):
+            if isinstance(pattern, (compat.basestring, bytes)):
+                if isinstance(pattern, bytes):
+                    regexes.append(b'(' + pattern + b')')
+                else:
+                    regexes.append(u'(' + pattern + u')')
+                ngroups = re.compile(pattern, flags).groups
+                groupindex.append(ix)
+                groupindex.extend([None] * ngroups)
+            elif isinstance(pattern, type) and issubclass(pattern, Exception):
+                exceptions.append((ix, pattern))
+            else:
+                raise TypeError('Expecting (list of) string or Exception')
+        self._groupindex = groupindex
+        if regexes:
+            # Bytes patterns are needed to search bytes on Python 3.
+            if isinstance(regexes[0], bytes):
+                pattern = b'|'.join(regexes)
+            else:
+                pattern = u'|'.join(regexes)
+            self.regex = re.compile(pattern, flags)
+            self.empty = pattern[:0]
+            tree = sre_parse.parse(pattern, flags)
+            if maxlen is None:
+                maxlen = _max_match_length(tree)
+            self.looks_behind = _looks_behind(tree)
+        else:
+            self.regex = None
+            self.empty = b''
+            self.looks_behind = False
+        # A match may depend on one character after it (for \b or $),
+        # which is why the overlap is one more than the match length.
+        self.maxlen = maxlen
+        self.overlap = maxlen + 1 if maxlen is not None else None
+        self.patterns = tuple(patterns)
+        self.exceptions = tuple(exceptions)
+        self.ignorecase = bool(ignorecase)
+
+    def find(self, data, pos, state=None, end=None):
+        """Find the first match in `data[:end]` starting at `pos`.
+
+        The return value is a (result, state) tuple. The result is a
+        (index, start, end, match) tuple, or None if there is no match. The
+        state must be passed back in when continuing the search with more
+        data. Pattern sets do not need any state so it is always None.
+        """
+        if self.regex is None:
+            return None, None
+        if end is None:
+            end = len(data)
+        match = self.regex.search(data, pos, end)
+        if not match:
+            return None, None
+        index = self._groupindex[match.lastindex]
+        return (index, match.start(), match.end(), match), None
+
+    def groups(self, match):
+        """Return the groups of the pattern that produced `match`.
+
+        This returns what ``match.groups()`` would return if the pattern
+        had been matched on its own.
+        """
+        first = match.lastindex
+        last = first + 1
+        while last < len(self._groupindex) and self._groupindex[last] is None:
+            last += 1
+        return match.groups()[first:last-1]
+
+
+class LiteralSet(object):
+    """A compiled list of literal strings.
+
+    This is the equivalent of a `PatternSet` for `Searcher.search_exact()`.
+    The strings are matched literally using ``find()``, which is a lot
+    faster than matching a regular expression.
+
+    Alternatively the strings can be matched with an Aho-Corasick automaton.
+    The automaton keeps its state between reads and looks at every
+    character at most once, regardless of the number of strings. The
+    automaton runs in Python, and it is only faster than ``find()`` if the
+    strings start with a few distinct characters that are rare in the
+    input. The input up to those characters is skipped in C.
+    """
+
+    looks_behind = False
+
+    def __init__(self, patterns, automaton=False):
+        """Constructor.
+
+        The `patterns` argument must be a string, an exception, or a list
+        of strings and exceptions. If `automaton` is set, the strings are
+        matched using an Aho-Corasick automaton.
+        """
+        if not isinstance(patterns, list):
+            patterns = [patterns]
+        literals = []
+        exceptions = []
+        for ix,pattern in enumerate(patterns):
+            if isinstance(pattern, (compat.basestring, bytes)):
+                literals.append((ix, pattern))
+            elif isinstance(pattern, type) and issubclass(pattern, Exception):
+                exceptions.append((ix, pattern))
+            else:
+                raise TypeError('Expecting (list of) string or Exception')
+        if literals:
+            self.maxlen = max([len(literal) for ix,literal in literals])
+        else:
+            self.maxlen = 0
+        if automaton and self.maxlen:
+            self.automaton = Automaton([literal for ix,literal in literals])
+            self.overlap = 0
+        else:
+            self.automaton = None
+            self.overlap = max(0, self.maxlen - 1)
+        self.literals = tuple(literals)
+        self.empty = literals[0][1][:0] if literals else b''
+        self.patterns = tuple(patterns)
+        self.exceptions = tuple(exceptions)
+
+    def find(self, data, pos, state=None, end=None):
+        """Find the first match in `data[:end]` starting at `pos`.
+
+        The match that starts first wins. If multiple strings match at the
+        same position, the one that comes first in the list wins. The
+        return value is a (result, state) tuple. The result is a (index,
+        start, end, match) tuple where `match` is the string that matched,
+        or None if there is no match. The state is the automaton state, if
+        an automaton is used, and must be passed back in when continuing
+        the search with more data.
+        """
+        if end is None:
+            end = len(data)
+        if self.automaton is not None:
+            best, state = self.automaton.scan(data, pos, end, state or 0)
+            if best is None:
+                return None, state
+            ix, start, end = best
+            index, literal = self.literals[ix]
+            return (index, start, end, literal), None
+        best = None
+        for ix,literal in self.literals:
+            if best is None:
+                limit = end
+            else:
+                # A better match needs to start before the current one.
+                limit = min(end, best[1] + len(literal) - 1)
+            start = data.find(literal, pos, limit)
+            if start != -1:
+                best = (ix, start, start + len(literal), literal)
+        return best, None
+
+
+_cache = OrderedDict()
+_cache_size = 100
+_cache_lock = threading.Lock()
+
+def _cached(key, factory, *args):
+    """Return factory(*args), using the cache entry for `key` if any."""
+    try:
+        with _cache_lock:
+            value = _cache.pop(key)
+            _cache[key] = value
+        return value
+    except KeyError:
+        pass
+    except TypeError:
+        # Unhashable pattern: the factory will complain.
+        return factory(*args)
+    # Compile outside the lock. Two threads may compile the same patterns,
+    # which is harmless.
+    value = factory(*args)
+    with _cache_lock:
+        _cache.pop(key, None)
+        if len(_cache) >= _cache_size:
+            _cache.popitem(last=False)
+        _cache[key] = value
+    return value
+
+def compile_patterns(patterns, ignorecase=False):
+    """Return a `PatternSet` for `patterns`.
+
+    The result is cached in a bounded LRU cache keyed on the patterns and
+    the `ignorecase` flag, so repeated searches for the same list of
+    patterns reuse the same compiled pattern set.
+    """
+    if isinstance(patterns, list):
+        key = (PatternSet, tuple(patterns), bool(ignorecase))
+    else:
+        key = (PatternSet, (patterns,), bool(ignorecase))
+    return _cached(key, PatternSet, patterns, ignorecase)
+
+def compile_literals(patterns, automaton=False):
+    """Return a `LiteralSet` for `patterns`.
+
+    The result is cached in the same way as for `compile_patterns()`.
+    """
+    if isinstance(patterns, list):
+        key = (LiteralSet, tuple(patterns), bool(automaton))
+    else:
+        key = (LiteralSet, (patterns,), bool(automaton))
+    return _cached(key, LiteralSet, patterns, automaton)
+
+
 class Searcher(object):
     """Searcher.
 
     This class passes over an input stream matching patterns.
     """
 
+    _readinto = True
+
     def __init__(self, stream, maxread=2000, searchwindowsize=None,
-                 ignorecase=False):
+                 ignorecase=False, encoding=None, binary=False,
+                 readpolicy=None):
         """Constructor.
         
         The `stream` argument must be a file descriptor, a file objects
@@ -31,12 +345,88 @@ class Searcher(object):
         a time. The search window determines the amount of characters at the
         end of the current position to look for a match. And if ignorecase
         is set, a case insensitive match is used.
+
+        The `encoding` parameter specifies the encoding of the input. If it
+        is provided, the input is decoded and searched as text, unless
+        `binary` is set. In binary mode, the input, the patterns and the
+        `before` and `after` attributes are all bytes, which avoids the
+        cost of decoding. Text patterns are encoded with the encoding, or
+        ASCII if there is none. Use `decode()` to decode data when needed.
+
+        The `readpolicy` parameter can be used to pass a `ReadPolicy` that
+        decides how many bytes are read at a time. By default `maxread`
+        bytes are read.
         """
         self.stream = stream
         self.maxread = maxread
         self.searchwindowsize = searchwindowsize
         self.ignorecase = ignorecase
-        self.buffer = ''
+        self.encoding = encoding
+        self.binary = binary
+        self.readpolicy = readpolicy
+        if encoding and not binary:
+            self._decoder = codecs.getincrementaldecoder(encoding)()
+        else:
+            self._decoder = None
+        self._buffer = Buffer(self._decoder is not None)
+        # The patterns, position and state of the last incomplete scan.
+        self._scanstate = None
+        self._span = None
+        self._before = None
+        self._after = None
+        self.match = None
+        self.match_index = None
+
+    def _setspan(self, data, start, matchstart, matchend):
+        """Record the location of `before` and `after` in `data`."""
+        self._span = (data, start, matchstart, matchend)
+        self._before = None
+        self._after = None
+
+    @property
+    def before(self):
+        """The data before the last match.
+
+        This is only copied out of the buffer when it is first accessed.
+        """
+        if self._before is None and self._span is not None:
+            data, start, matchstart, matchend = self._span
+            self._before = extract(data, start, matchstart)
+            if self._after is not None:
+                self._span = None
+        return self._before
+
+    @before.setter
+    def before(self, before):
+        self._before = before
+
+    @property
+    def after(self):
+        """The data that matched in the last match.
+
+        This is only copied out of the buffer when it is first accessed.
+        """
+        if self._after is None and self._span is not None:
+            data, start, matchstart, matchend = self._span
+            self._after = extract(data, matchstart, matchend)
+            if self._before is not None:
+                self._span = None
+        return self._after
+
+    @after.setter
+    def after(self, after):
+        self._after = after
+
+    @property
+    def buffer(self):
+        """The data that has been read but not yet consumed by a match."""
+        return self._buffer.getvalue()
+
+    @buffer.setter
+    def buffer(self, buf):
+        self._buffer.clear()
+        self._buffer.append(buf)
+        self._scanstate = None
 
     def read(self, size):
         """Read up to `size` bytes form the input.
@@ -55,11 +445,61 @@ class Searcher(object):
         else:
             raise TypeError('Expecting a file descriptor, file, or socket')
 
+    def readinto(self, buf):
+        """Read up to ``len(buf)`` bytes from the input into `buf`.
+
+        The return value is the number of bytes read. If the input does not
+        support reading into a buffer, None is returned and `read()` is used
+        instead.
+        """
+        stream = self.stream
+        if isinstance(stream, int):
+            return compat.readinto(stream, buf)
+        elif hasattr(stream, 'readinto'):
+            return stream.readinto(buf)
+        elif hasattr(stream, 'recv_into'):
+            return stream.recv_into(buf)
+
+    def available(self):
+        """Return the number of bytes that can be read without blocking,
+        or None if this is not known."""
+
+    def _fill(self, size):
+        """Read up to `size` bytes from the input into the buffer.
+
+        The return value is the number of bytes read, which is 0 at the end
+        of the input. Undecoded bytes are read straight into the buffer
+        with `readinto()`, if the input supports it.
+        """
+        buffer = self._buffer
+        if self._readinto and self._decoder is None and \
+                    (isinstance(buffer.data, bytearray) or not buffer):
+            nbytes = self.readinto(buffer.reserve(size))
+            if nbytes is not None:
+                buffer.commit(nbytes)
+                return nbytes
+            self._readinto = False
+        buf = self.read(size)
+        if buf and self._decoder is not None:
+            buffer.append(self._decoder.decode(buf))
+        else:
+            buffer.append(buf)
+        return len(buf)
+
+    def decode(self, buf, errors='strict'):
+        """Decode `buf` using the encoding of the input.
+
+        If no encoding is known, `buf` is returned as is.
+        """
+        if not self.encoding or isinstance(buf, compat.unicode):
+            return buf
+        return buf.decode(self.encoding, errors)
+
     def search(self, pattern, maxread=-1, searchwindowsize=-1, ignorecase=-1):
         """Search for `pattern` in the input.
 
-        The `pattern` parameter must be a string, an exception, or a list of
-        strings and exceptions.
+        The `pattern` parameter must be a string, an exception, a list of
+        strings and exceptions, or a `PatternSet`.
 
         If the pattern is found, the index of the match in the pattern list
         is returned. If pattern was not a list, then 0 is returned as the
@@ -67,65 +507,173 @@ class Searcher(object):
 
         The parameters `maxread`, `searchwindowsize` and `ignorecase`, if
         provided, override the values given for those paramters in the
-        constructor.
+        constructor. A `maxread` value also overrides the read policy. The
+        `ignorecase` parameter has no effect if `pattern` is a `PatternSet`.
+        """
+        if ignorecase == -1:
+            ignorecase = self.ignorecase
+        pattern = self._compile(pattern, ignorecase)
+        return self._search(pattern, maxread, searchwindowsize)
+
+    def search_exact(self, pattern, maxread=-1, searchwindowsize=-1):
+        """Search for the literal string `pattern` in the input.
+
+        This is like `search()` but the strings in `pattern` are not
+        regular expressions and are matched exactly. The `pattern`
+        parameter may also be a `LiteralSet`. After a match, the `match`
+        attribute is set to the string that matched.
         """
-        if maxread == -1:
+        pattern = self._compile_exact(pattern)
+        return self._search(pattern, maxread, searchwindowsize)
+
+    def _encode(self, pattern):
+        """In binary mode, encode the text in `pattern` with the encoding of
+        the input, or ASCII if it is not known."""
+        if not self.binary:
+            return pattern
+        encoding = self.encoding or 'ascii'
+        if isinstance(pattern, compat.unicode):
+            return pattern.encode(encoding)
+        elif isinstance(pattern, list):
+            return [p.encode(encoding) if isinstance(p, compat.unicode)
+                    else p for p in pattern]
+        return pattern
+
+    def _compile(self, pattern, ignorecase):
+        """Return `pattern` as a `PatternSet` or `LiteralSet`."""
+        if isinstance(pattern, (PatternSet, LiteralSet)):
+            return pattern
+        return compile_patterns(self._encode(pattern), ignorecase)
+
+    def _compile_exact(self, pattern):
+        """Return `pattern` as a `LiteralSet`."""
+        if isinstance(pattern, LiteralSet):
+            return pattern
+        return compile_literals(self._encode(pattern))
+
+    def _search(self, pattern, maxread, searchwindowsize):
+        """Search for the compiled pattern set `pattern`."""
+        readpolicy = self.readpolicy
+        if maxread != -1:
+            readpolicy = None
+        elif readpolicy is None:
             maxread = self.maxread
         if searchwindowsize == -1:
             searchwindowsize = self.searchwindowsize
-        if ignorecase == -1:
-            ignorecase = self.ignorecase
-        patterns = []
-        exception_list = []
-        if not isinstance(pattern, list):
-            pattern = [pattern]
-        for ix,pattern in enumerate(pattern):
-            if isinstance(pattern, compat.basestring):
-                patterns.append('(?P<pattern_%d>%s)' % (ix, pattern))
-            elif issubclass(pattern, Exception):
-                exception_list.append((ix, pattern))
-            else:
-                raise TypeError('Expecting (list of) string or Exception')
-        pattern = '|'.join([pattern for pattern in patterns])
-        flags = re.DOTALL
-        if self.ignorecase:
-            flags |= re.IGNORECASE
-        regex = re.compile(pattern, flags)
         while True:
-            if pattern:
-                match = regex.search(self.buffer)
-            else:
-                match = None
-            if match:
-                self.before = self.buffer[:match.start()]
-                self.after = self.buffer[match.start():match.end()]
-                self.match = match
-                for key,value in match.groupdict().iteritems():
-                    if key.startswith('pattern_') and value:
-                        index = int(key[8:])
-                        break
-                else:
-                    raise AssertionError('Got a match but not of the patterns matched??')
-                self.match_index = index
-                self.buffer = self.buffer[match.end():]
-                return self.match_index
+            index = self._scan(pattern)
+            if index is not None:
+                return index
             try:
-                buf = self.read(maxread)
+                self._readstep(readpolicy, maxread, searchwindowsize)
             except Exception as e:
-                exception = e
+                return self._fail(pattern, e)
+
+    def _readstep(self, readpolicy, maxread, searchwindowsize):
+        """Read once from the input into the buffer.
+
+        The read size is decided by `readpolicy`, or is `maxread` if there
+        is no read policy. EOF is raised at the end of the input.
+        """
+        if readpolicy is None:
+            size = maxread
+        else:
+            size = readpolicy.size(self.available)
+        try:
+            nbytes = self._fill(size)
+        except OSError as e:
+            # Reading from a pseudo terminal whose slave side was closed
+            # fails with EIO.
+            if e.errno != errno.EIO:
+                raise
+            nbytes = 0
+        if readpolicy is not None:
+            readpolicy.update(size, nbytes)
+        if not nbytes:
+            raise EOF('End of file')
+        if searchwindowsize is not None:
+            self._trim(searchwindowsize)
+
+    def _scan(self, pattern):
+        """Search for `pattern` in the data that was read so far.
+
+        If the pattern is found, the match is consumed and its index is
+        returned. Otherwise None is returned, and the position where the
+        search can continue when more data arrives is remembered.
+        """
+        # Resume scanning where the last search for the same patterns
+        # stopped, relative to the start of the unconsumed data. Data before
+        # that position is known not to match.
+        scanstate = self._scanstate
+        if scanstate is not None and scanstate[0] is pattern:
+            pos, state = scanstate[1:]
+        else:
+            pos = 0
+            state = None
+        buffer = self._buffer
+        if pattern.looks_behind:
+            # Make anchors and lookbehind assertions see the start of the
+            # unconsumed data as the start of the input.
+            buffer.compact()
+        data = buffer.data
+        if not buffer:
+            # Search an empty string of the type of the patterns. The buffer
+            # only gets the type of the input once data is read.
+            data = pattern.empty
+        result, state = pattern.find(data, buffer.start + pos, state,
+                                     buffer.end)
+        if result:
+            index, start, end, match = result
+            self._setspan(data, buffer.start, start, end)
+            self.match = match
+            self.match_index = index
+            buffer.consume(end)
+            self._scanstate = None
+            return index
+        if pattern.overlap is not None:
+            pos = max(0, len(buffer) - pattern.overlap)
+        self._scanstate = (pattern, pos, state)
+
+    def _fail(self, pattern, exception):
+        """Handle `exception` while searching for `pattern`.
+
+        If the exception is in the pattern list, the buffer is consumed and
+        its index is returned. Otherwise the exception is raised.
+        """
+        for ix,e in pattern.exceptions:
+            if isinstance(exception, e):
+                buffer = self._buffer
+                self._setspan(buffer.data, buffer.start, buffer.end, buffer.end)
+                buffer.clear()
+                self._scanstate = None
+                self.match = None
+                self.match_index = ix
+                return ix
+        raise exception
+
+    def _trim(self, searchwindowsize):
+        """Limit the unconsumed data to the last `searchwindowsize` bytes."""
+        trimmed = self._buffer.trim(searchwindowsize)
+        scanstate = self._scanstate
+        if trimmed and scanstate is not None:
+            pattern, pos, state = scanstate
+            if state is not None:
+                # The automaton state describes data that may have been
+                # trimmed. Scan the remaining data again from the start.
+                self._scanstate = (pattern, 0, None)
             else:
-                exception = None if buf else EOF('End of file')
-            if exception:
-                for ix,e in exception_list:
-                    if isinstance(exception, e):
-                        self.before = self.buffer
-                        self.after = ''
-                        self.buffer = ''
-                        self.match = None
-                        self.match_index = ix
-                        return ix
-                else:
-                    raise exception
-            self.buffer += buf
-            if searchwindowsize is not None and len(buffer) > searchwindowsize:
-                self.buffer = self.buffer[-searchwindowsize:]
+                self._scanstate = (pattern, max(0, pos - trimmed), state)
+
+    def release(self):
+        """Release the memory that is not needed while the input is idle.
+
+        The `before` and `after` attributes are copied out of the buffer,
+        and the spare space of the buffer is freed. A regular expression
+        `match` references all data that was searched, so it is cleared.
+        """
+        self._before, self._after = self.before, self.after
+        self._span = None
+        if not isinstance(self.match, (bytes, compat.unicode)):
+            self.match = None
+        self._buffer.shrink()
+        self._scanstate = None
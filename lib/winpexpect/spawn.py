@@ -6,11 +6,124 @@
 # WinPexpect is copyright (c) 2010-2012 by the WinPexpect authors. See the
 # file "AUTHORS" for a complete overview.
 
+import threading
+
+from collections import namedtuple
+
+from winpexpect import compat
+from winpexpect.search import Searcher
+
+
+class SpawnConfig(namedtuple('SpawnConfig', ('command', 'args', 'cwd',
+        'env', 'closefds', 'keepfds', 'termmodes', 'encoding', 'maxread',
+        'searchwindowsize', 'ignorecase', 'binary'))):
+    """The configuration of a spawn object.
+
+    The configuration does not change when a session runs, so sessions that
+    are spawned from the same `SpawnTemplate` share one instance.
+    """
+
+    __slots__ = ()
+
+SpawnConfig.default = SpawnConfig(*[None] * len(SpawnConfig._fields))
+
+
+def _config_property(name):
+    """Return a property for the configuration item `name`.
+
+    Setting the property replaces the configuration of the session, so
+    that a change never affects other sessions that shared it.
+    """
+    def get(self):
+        return getattr(self._config, name)
+    def set(self, value):
+        self._config = self._config._replace(**{name: value})
+    return property(get, set)
+
 
 class Spawn(object):
-    """Spawn object.
-    
-    This object is mixed in with Process, Terminal and NBIO to produce
-    the pexpect spawn() API.
+    """Base class of the objects returned by `spawn()`.
+
+    A spawn object is an instance of a class that combines this class with
+    an NBIO, a Process and a Terminal class, and `Searcher`. These classes
+    are created by `spawn_class()` and are cached, so that spawning does
+    not create a new class every time.
+
+    The state of a session is kept by the classes it combines. The items
+    of its configuration are stored in a `SpawnConfig` instead.
     """
 
+    nbio_class = None
+    process_class = None
+    terminal_class = None
+    _config = SpawnConfig.default
+
+    def __init__(self, command, args=None, cwd=None, env=None, timeout=30,
+                 maxread=200, searchwindowsize=None, ignorecase=False,
+                 text=False, readpolicy=None, termmodes=None):
+        cls = type(self)
+        if termmodes is None:
+            cls.process_class.__init__(self, command, args, cwd, env)
+        else:
+            cls.process_class.__init__(self, command, args, cwd, env,
+                                       termmodes=termmodes)
+        cls.process_class.start(self)
+        self._setup(timeout, maxread, searchwindowsize, ignorecase, text,
+                    readpolicy)
+
+    def _setup(self, timeout, maxread, searchwindowsize, ignorecase, text,
+               readpolicy):
+        """Set up the session once the process has been started."""
+        cls = type(self)
+        fd = cls.process_class.fileno(self)
+        cls.terminal_class.__init__(self, fd)
+        cls.nbio_class.__init__(self, fd, timeout)
+        Searcher.__init__(self, fd, maxread, searchwindowsize, ignorecase,
+                          self.encoding, not text, readpolicy)
+
+    def send(self, buf):
+        """Write `buf` to the child. Text is encoded first."""
+        if isinstance(buf, compat.unicode):
+            buf = buf.encode(self.encoding or 'ascii')
+        return self.write(buf)
+
+    expect = Searcher.search
+    expect_exact = Searcher.search_exact
+
+    def close(self):
+        """Close the pty, and release the memory of the session."""
+        type(self).process_class.close(self)
+        self.release()
+
+    def release(self):
+        """Release the memory that is not needed while the session is idle.
+
+        See ``Searcher.release()``.
+        """
+        Searcher.release(self)
+        type(self).nbio_class.release(self)
+
+for name in SpawnConfig._fields:
+    setattr(Spawn, name, _config_property(name))
+del name
+
+
+_classes = {}
+_lock = threading.Lock()
+
+def spawn_class(nbio_class, process_class, terminal_class):
+    """Return the spawn class that combines the given classes."""
+    key = (nbio_class, process_class, terminal_class)
+    cls = _classes.get(key)
+    if cls is not None:
+        return cls
+    with _lock:
+        cls = _classes.get(key)
+        if cls is None:
+            bases = (Spawn, nbio_class, process_class, terminal_class,
+                     Searcher)
+            cls = type('Spawn', bases, { 'nbio_class': nbio_class,
+                                         'process_class': process_class,
+                                         'terminal_class': terminal_class })
+            _classes[key] = cls
+    return cls
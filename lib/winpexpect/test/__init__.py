@@ -52,6 +52,8 @@ class UnitTest(object):
     def tempfile(self, contents=None):
         fd, fname = tempfile.mkstemp(dir=self.tmpdir)
         if contents is not None:
+            if not isinstance(contents, bytes):
+                contents = contents.encode('ascii')
             os.write(fd, contents)
         os.close(fd)
         return fname
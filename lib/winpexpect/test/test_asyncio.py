@@ -0,0 +1,97 @@
+#
+# This file is part of WinPexpect. WinPexpect is free software that is made
+# available under the MIT license. Consult the file "LICENSE" that is
+# distributed together with this file for the exact licensing terms.
+#
+# WinPexpect is copyright (c) 2010-2012 by the WinPexpect authors. See the
+# file "AUTHORS" for a complete overview.
+
+import time
+from nose import SkipTest
+
+import winpexpect
+from winpexpect import *
+from winpexpect.test import *
+
+
+class TestAsyncioNBIO(PosixTest):
+
+    @classmethod
+    def setup_class(cls):
+        if not hasattr(winpexpect, 'AsyncioNBIO'):
+            raise SkipTest('This test requires asyncio')
+        super(TestAsyncioNBIO, cls).setup_class()
+
+    def setup(self):
+        super(TestAsyncioNBIO, self).setup()
+        import asyncio
+        self.loop = asyncio.new_event_loop()
+
+    def teardown(self):
+        self.loop.close()
+        super(TestAsyncioNBIO, self).teardown()
+
+    def cat(self, timeout=5):
+        return spawn('/bin/cat', timeout=timeout, nbio_class=AsyncioNBIO)
+
+    def run(self, future):
+        return self.loop.run_until_complete(future)
+
+    def test_expect(self):
+        cat = self.cat()
+        cat.loop = self.loop
+        assert self.run(cat.send_async(b'foo bar\n')) == 8
+        assert self.run(cat.expect_async(b'b.r')) == 0
+        assert cat.before == b'foo '
+        assert self.run(cat.expect_exact_async([b'xyz', b'\r\n'])) == 1
+        # Data that was already read is searched first.
+        cat.send(b'baz\n')
+        assert cat.expect(b'baz') == 0
+        assert self.run(cat.expect_exact_async(b'\r\n')) == 0
+        cat.terminate()
+
+    def test_many(self):
+        import asyncio
+        cats = [self.cat() for i in range(10)]
+        for cat in cats:
+            cat.loop = self.loop
+        for i,cat in enumerate(cats):
+            cat.send(('line %d\n' % i).encode('ascii'))
+        futures = [cat.expect_async(b'line (\\d+)\r\n') for cat in cats]
+        self.run(asyncio.gather(*futures))
+        for i,cat in enumerate(cats):
+            assert cat.match.group(2) == str(i).encode('ascii')
+            cat.terminate()
+
+    def test_timeout(self):
+        cat = self.cat(timeout=0.2)
+        cat.loop = self.loop
+        start = time.time()
+        assert self.run(cat.expect_async([b'foo', TIMEOUT])) == 1
+        assert time.time() - start < 1.0
+        future = cat.expect_async(b'foo')
+        assert_raises(TIMEOUT, self.run, future)
+        cat.terminate()
+
+    def test_eof_and_wait(self):
+        cat = self.cat()
+        cat.loop = self.loop
+        cat.send(cat.cchar('VEOF'))
+        assert self.run(cat.expect_async([b'foo', EOF])) == 1
+        assert self.run(cat.wait_async(5)) is True
+        assert cat.exitstatus == 0
+
+    def test_wait_reaper(self):
+        from winpexpect.posix import PosixProcess
+        from winpexpect.reaper import Reaper
+        reaper = Reaper()
+        reaper.start()
+        PosixProcess.reaper = reaper
+        try:
+            for i in range(100):
+                proc = spawn('/bin/true', nbio_class=AsyncioNBIO)
+                proc.loop = self.loop
+                assert self.run(proc.wait_async(2)) is True
+        finally:
+            PosixProcess.reaper = None
+            reaper.stop()
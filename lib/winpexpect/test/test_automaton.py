@@ -0,0 +1,70 @@
+#
+# This file is part of WinPexpect. WinPexpect is free software that is made
+# available under the MIT license. Consult the file "LICENSE" that is
+# distributed together with this file for the exact licensing terms.
+#
+# WinPexpect is copyright (c) 2010-2012 by the WinPexpect authors. See the
+# file "AUTHORS" for a complete overview.
+
+from winpexpect.automaton import Automaton
+from winpexpect.test import *
+
+
+class TestAutomaton(UnitTest):
+
+    def test_scan(self):
+        automaton = Automaton(['he', 'she', 'his', 'hers'])
+        data = b'ushers'
+        match, state = automaton.scan(data, 0, len(data))
+        assert match == (1, 1, 4)
+        data = b'xxhisxx'
+        match, state = automaton.scan(data, 0, len(data))
+        assert match == (2, 2, 5)
+        data = b'xxxxx'
+        match, state = automaton.scan(data, 0, len(data))
+        assert match is None
+
+    def test_leftmost(self):
+        automaton = Automaton(['bc', 'abcd', 'ab'])
+        data = b'xabcd'
+        match, state = automaton.scan(data, 0, len(data))
+        assert match == (1, 1, 5)
+        automaton = Automaton(['bc', 'ab', 'abcd'])
+        match, state = automaton.scan(data, 0, len(data))
+        assert match == (1, 1, 3)
+        automaton = Automaton(['bc', 'abcd'])
+        match, state = automaton.scan(data, 0, len(data))
+        assert match == (1, 1, 5)
+        # The longer string has not been completely received yet.
+        match, state = automaton.scan(data, 0, 4)
+        assert match == (0, 2, 4)
+
+    def test_streaming(self):
+        automaton = Automaton(['prompt> ', 'error'])
+        data = bytearray(b'xxxpro')
+        match, state = automaton.scan(data, 0, len(data))
+        assert match is None
+        pos = len(data)
+        data += b'mpt> '
+        match, state = automaton.scan(data, pos, len(data), state)
+        assert match == (0, 3, 11)
+
+    def test_text(self):
+        automaton = Automaton([u'caf\xe9', u'th\xe9'])
+        data = u'un th\xe9'
+        match, state = automaton.scan(data, 0, len(data))
+        assert match == (1, 3, 6)
+
+    def test_skip(self):
+        automaton = Automaton(['%ERROR', '%WARN'])
+        data = b'x' * 100 + b'%WAR%ERROR'
+        match, state = automaton.scan(data, 0, len(data))
+        assert match == (0, 104, 110)
+        match, state = automaton.scan(data, 0, 103)
+        assert match is None
+        assert state != 0
+        match, state = automaton.scan(data, 103, len(data), state)
+        assert match == (0, 104, 110)
+        data = u'\xe9' * 10 + u'%WARN'
+        match, state = automaton.scan(data, 0, len(data))
+        assert match == (1, 10, 15)
@@ -0,0 +1,106 @@
+#
+# This file is part of WinPexpect. WinPexpect is free software that is made
+# available under the MIT license. Consult the file "LICENSE" that is
+# distributed together with this file for the exact licensing terms.
+#
+# WinPexpect is copyright (c) 2010-2012 by the WinPexpect authors. See the
+# file "AUTHORS" for a complete overview.
+
+from winpexpect.buffer import Buffer
+from winpexpect.test import *
+
+
+class TestBuffer(UnitTest):
+
+    def test_append(self):
+        buf = Buffer()
+        assert len(buf) == 0
+        buf.append(b'foo')
+        buf.append(b'bar')
+        assert isinstance(buf.data, bytearray)
+        assert len(buf) == 6
+        assert buf.getvalue() == b'foobar'
+        assert isinstance(buf.getvalue(), bytes)
+
+    def test_append_text(self):
+        buf = Buffer()
+        buf.append(u'foo')
+        buf.append(u'bar')
+        assert buf.getvalue() == u'foobar'
+        assert_raises(TypeError, buf.append, b'baz')
+        buf.clear()
+        buf.append(b'baz')
+        assert buf.getvalue() == b'baz'
+
+    def test_append_text_chunks(self):
+        buf = Buffer(True)
+        buf.append(u'foo')
+        buf.append(u'bar')
+        assert len(buf) == 6
+        assert buf.data == u'foobar'
+        buf.consume(2)
+        buf.append(u'baz')
+        assert buf.getvalue() == u'obarbaz'
+        assert buf.data == u'foobarbaz'
+        buf.clear()
+        buf.append(u'qux')
+        assert buf.data == u'qux'
+
+    def test_consume(self):
+        buf = Buffer()
+        buf.append(b'foobar')
+        data = buf.data
+        buf.consume(3)
+        assert buf.data is data
+        assert buf.start == 3
+        assert buf.getvalue() == b'bar'
+        assert buf.slice(buf.start, buf.start+2) == b'ba'
+        buf.consume(6)
+        assert len(buf) == 0
+        assert buf.start == 0
+
+    def test_compact(self):
+        buf = Buffer()
+        size = Buffer.compact_threshold
+        buf.append(size * b'x')
+        buf.append(size * b'y')
+        buf.consume(size - 1)
+        assert buf.start == size - 1
+        data = buf.data
+        buf.consume(size)
+        assert buf.start == 0
+        assert buf.data is not data
+        assert buf.getvalue() == size * b'y'
+        assert data == size * b'x' + size * b'y'
+
+    def test_trim(self):
+        buf = Buffer()
+        buf.append(b'foobar')
+        assert buf.trim(10) == 0
+        assert buf.trim(4) == 2
+        assert buf.getvalue() == b'obar'
+
+    def test_reserve(self):
+        buf = Buffer()
+        buf.append(b'foo')
+        view = buf.reserve(10)
+        assert len(view) == 10
+        view[:3] = b'bar'
+        buf.commit(3)
+        assert buf.getvalue() == b'foobar'
+        data = buf.data
+        buf.reserve(len(data))
+        assert buf.data is not data
+        assert buf.getvalue() == b'foobar'
+        assert buf.end == 6
+
+    def test_shrink(self):
+        buf = Buffer()
+        buf.append(b'foobar')
+        buf.reserve(100)
+        buf.consume(3)
+        buf.shrink()
+        assert len(buf.data) == 3
+        assert buf.getvalue() == b'bar'
+        buf = Buffer(True)
+        assert buf.data == u''
@@ -0,0 +1,100 @@
+#
+# This file is part of WinPexpect. WinPexpect is free software that is made
+# available under the MIT license. Consult the file "LICENSE" that is
+# distributed together with this file for the exact licensing terms.
+#
+# WinPexpect is copyright (c) 2010-2012 by the WinPexpect authors. See the
+# file "AUTHORS" for a complete overview.
+
+import os
+import signal
+import struct
+
+from winpexpect import *
+from winpexpect.forkserver import ForkServer, ForkServerProcess, _recv
+from winpexpect.test import *
+
+
+class TestForkServer(PosixTest):
+
+    def setup(self):
+        super(TestForkServer, self).setup()
+        self.server = ForkServer()
+        self.server.start()
+
+    def teardown(self):
+        self.server.stop()
+        super(TestForkServer, self).teardown()
+
+    def test_process(self):
+        modes = TerminalModes(winsize=(30, 100))
+        cat = ForkServerProcess('/bin/cat', server=self.server,
+                                termmodes=modes)
+        cat.start()
+        terminal = Terminal(cat.fileno())
+        assert terminal.getwinsize() == (30, 100)
+        cat.write(b'foo\n')
+        assert NBIO(cat.fileno(), 2).read(100).startswith(b'foo')
+        # The child is a child of the fork server.
+        stat = open('/proc/%d/stat' % cat.pid).read() \
+                    if os.path.exists('/proc') else None
+        if stat is not None:
+            assert int(stat.split(')')[1].split()[1]) == self.server.pid
+        cat.write(terminal.cchar('VEOF'))
+        assert cat.wait(5)
+        assert cat.exitstatus == 0
+        assert cat.termsig is None
+
+    def test_termmodes(self):
+        modes = TerminalModes(echo=False, onlcr=False)
+        cat = ForkServerProcess('/bin/cat', server=self.server,
+                                termmodes=modes)
+        cat.start()
+        assert not Terminal(cat.fileno()).getecho()
+        cat.write(b'foo\n')
+        assert NBIO(cat.fileno(), 2).read(100) == b'foo\n'
+        cat.kill(signal.SIGKILL)
+        assert cat.wait(5)
+
+    def test_kill(self):
+        cat = ForkServerProcess('/bin/cat', server=self.server)
+        cat.start()
+        assert cat.isalive()
+        cat.kill(signal.SIGTERM)
+        cat.wait()
+        assert not cat.isalive()
+        assert cat.termsig == signal.SIGTERM
+
+    def test_bad_request(self):
+        assert_raises(ValueError, self.server._call, 'nonexistent')
+        assert_raises(TypeError, self.server.waitpid, 'nopid', 0)
+        # A request that cannot be unpickled.
+        self.server._sock.sendall(struct.pack('!I', 3) + b'foo')
+        response = _recv(self.server._sock)
+        assert response[0] == 'exception'
+        # The server keeps serving requests.
+        cat = ForkServerProcess('/bin/cat', server=self.server)
+        cat.start()
+        cat.kill(signal.SIGKILL)
+        assert cat.wait(5)
+        assert cat.termsig == signal.SIGKILL
+
+    def test_lazy_start(self):
+        server = ForkServer()
+        try:
+            cat = ForkServerProcess('/bin/cat', server=server)
+            cat.start()
+            assert server.pid is not None
+            cat.kill(signal.SIGKILL)
+            assert cat.wait(5)
+        finally:
+            server.stop()
+
+    def test_spawn(self):
+        env = { 'PS1': '$ ', 'HOME': os.getcwd() }
+        shell = spawn('/bin/sh', env=env, timeout=2,
+                      process_class=ForkServerProcess)
+        shell.expect_exact('$ ')
+        shell.send('echo $((6*7))\n')
+        shell.expect_exact('42\r\n')
+        assert shell.terminate(2)
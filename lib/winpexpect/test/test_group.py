@@ -0,0 +1,88 @@
+#
+# This file is part of WinPexpect. WinPexpect is free software that is made
+# available under the MIT license. Consult the file "LICENSE" that is
+# distributed together with this file for the exact licensing terms.
+#
+# WinPexpect is copyright (c) 2010-2012 by the WinPexpect authors. See the
+# file "AUTHORS" for a complete overview.
+
+import os
+import time
+
+from winpexpect import *
+from winpexpect.test import *
+
+
+class TestExpectGroup(PosixTest):
+
+    def shell(self):
+        env = { 'PS1': '$ ', 'HOME': os.getcwd() }
+        return spawn('/bin/sh', env=env, timeout=5)
+
+    def test_expect_any(self):
+        group = ExpectGroup()
+        shells = [self.shell() for i in range(10)]
+        for shell in shells:
+            group.expect_exact(shell, '$ ')
+        done = []
+        while len(group):
+            done += group.expect_any()
+        assert sorted(map(id, [s for s,r in done])) == sorted(map(id, shells))
+        assert all([result == 0 for shell,result in done])
+        group.close()
+
+    def test_run(self):
+        group = ExpectGroup()
+        results = {}
+        def prompt(shell, result):
+            assert result == 0
+            shell.send('echo $((%d*2))\n' % id(shell))
+            group.expect(shell, ['\\d+\r\n\\$ ', EOF], callback=output)
+        def output(shell, result):
+            results[id(shell)] = shell.after.split()[0]
+        shells = [self.shell() for i in range(5)]
+        for shell in shells:
+            group.expect_exact(shell, '$ ', callback=prompt)
+        group.run()
+        for shell in shells:
+            assert results[id(shell)] == str(id(shell) * 2).encode('ascii')
+        group.close()
+
+    def test_timeout(self):
+        group = ExpectGroup()
+        shell = self.shell()
+        group.expect_exact(shell, '$ ')
+        group.run()
+        group.expect_exact(shell, ['nomatch', TIMEOUT], timeout=0.2)
+        start = time.time()
+        assert group.expect_any() == [(shell, 1)]
+        assert time.time() - start < 1.0
+        group.expect_exact(shell, 'nomatch', timeout=0.2)
+        [(session, result)] = group.expect_any()
+        assert isinstance(result, TIMEOUT)
+        assert group.expect_any() == []
+        group.close()
+
+    def test_spurious_wakeup(self):
+        group = ExpectGroup()
+        shell = self.shell()
+        group.expect_exact(shell, '$ ')
+        group.run()
+        group.expect_exact(shell, 'nomatch')
+        # Processing a session that has nothing to read does not block.
+        start = time.time()
+        group._process(shell.fileno())
+        assert time.time() - start < 1.0
+        assert shell.timeout == 5
+        assert len(group) == 1
+        group.close()
+
+    def test_eof(self):
+        group = ExpectGroup()
+        shell = self.shell()
+        group.expect_exact(shell, '$ ')
+        group.run()
+        shell.send('exit\n')
+        group.expect_exact(shell, ['nomatch', EOF])
+        assert group.expect_any(5) == [(shell, 1)]
+        group.close()
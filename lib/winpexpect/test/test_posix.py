@@ -45,13 +45,35 @@ class TestPosixProcess(PosixTest):
     def test_which(self):
         os.mkdir('bin')
         self.open('bin/foo', 'w')
-        os.chmod('bin/foo', 0755)
+        os.chmod('bin/foo', 0o755)
         assert which('bin/foo') is None
         assert which('./bin/foo') == os.path.abspath('./bin/foo')
         assert which('bin/bar') is None
         assert which('./bin/bar') is None
         assert which('/bin/sh') == '/bin/sh'
 
+    def test_closefrom(self):
+        from winpexpect import posix
+        def check(close_range):
+            fds = [os.open('/dev/null', os.O_RDONLY) for i in range(4)]
+            pid = os.fork()
+            if pid == 0:
+                posix._close_range = close_range
+                closefrom(fds[0], [fds[1], fds[3]])
+                closed = []
+                for fd in fds:
+                    try:
+                        os.fstat(fd)
+                    except OSError:
+                        closed.append(fd)
+                os._exit(0 if closed == [fds[0], fds[2]] else 1)
+            for fd in fds:
+                os.close(fd)
+            pid, status = os.waitpid(pid, 0)
+            assert os.WIFEXITED(status) and os.WEXITSTATUS(status) == 0
+        check(posix._close_range)
+        check(None)
+
     def test_process(self):
         cat = PosixProcess('/bin/cat')
         cat.start()
@@ -62,15 +84,50 @@ class TestPosixProcess(PosixTest):
         assert cat.termsig is None
         cat.write('foo\n')
         line = cat.read(10)
-        assert line == 'foo\r\n'
+        assert line == b'foo\r\n'
         assert cat.terminate(1.0)
         assert not cat.isalive()
         assert cat.exitstatus is None
         assert cat.termsig == signal.SIGTERM
 
+    def test_wait_pidfd(self):
+        sleep = PosixProcess('/bin/sleep 0.2')
+        sleep.start()
+        if sleep.pidfd is None:
+            raise SkipTest('This test requires pidfd support')
+        pidfd = sleep.pidfd
+        assert select.select([pidfd], [], [], 0)[0] == []
+        assert not sleep.wait(0.05)
+        start = time.time()
+        assert sleep.wait(5)
+        assert time.time() - start < 0.5
+        assert sleep.exitstatus == 0
+        assert sleep.pidfd is None
+        assert_raises(OSError, os.fstat, pidfd)
+
+    def test_read_multibyte(self):
+        env = { 'LANG': 'C.UTF-8' }
+        cat = PosixProcess('/bin/cat', env=env)
+        cat.start()
+        assert cat.encoding == 'utf-8'
+        terminal = PosixTerminal(cat.fileno())
+        terminal.setecho(False)
+        cat.write(u'caf\xe9\n')
+        time.sleep(1)
+        # The first read ends halfway the two byte UTF-8 encoding of \xe9
+        assert cat.read(4) == u'caf'
+        assert cat.read(10) == u'\xe9\r\n'
+        cat.terminate()
+
     def test_hangup(self):
         cat = PosixProcess('/bin/cat')
         cat.start()
+        # Only hang up once cat runs. Before that, the pty may not be the
+        # controlling terminal of the child yet. The first line is the echo.
+        cat.write(b'foo\n')
+        output = b''
+        while output.count(b'foo') < 2:
+            output += cat.read(100)
         cat.close()
         assert cat.wait(1.0)
         assert not cat.isalive()
@@ -90,6 +147,91 @@ class TestPosixProcess(PosixTest):
         assert cat.termsig is None
 
 
+class TestTerminalModes(PosixTest):
+
+    def _check(self, process):
+        process.start()
+        terminal = PosixTerminal(process.fileno())
+        assert not terminal.getecho()
+        assert terminal.getwinsize() == (24, 132)
+        process.write(b'foo\n')
+        # No echo, and no CR before the NL.
+        assert PosixNBIO(process.fileno(), 2).read(100) == b'foo\n'
+        process.kill(signal.SIGKILL)
+        assert process.wait(5)
+
+    def test_forkpty(self):
+        modes = TerminalModes(echo=False, onlcr=False, winsize=(24, 132))
+        self._check(PosixProcess('/bin/cat', termmodes=modes))
+
+    def test_posix_spawn(self):
+        if not hasattr(os, 'posix_spawn'):
+            raise SkipTest('This test requires os.posix_spawn()')
+        modes = TerminalModes(echo=False, onlcr=False, winsize=(24, 132))
+        self._check(PosixSpawnProcess('/bin/cat', termmodes=modes))
+
+    def test_raw(self):
+        cat = PosixProcess('/bin/cat', termmodes=TerminalModes(raw=True))
+        cat.start()
+        # In raw mode, there is no line editing and ^C is just a byte.
+        cat.write(b'x\x7f\x03')
+        assert PosixNBIO(cat.fileno(), 2).read(100) == b'x\x7f\x03'
+        assert cat.isalive()
+        cat.kill(signal.SIGKILL)
+        assert cat.wait(5)
+
+
+class TestTerminateAll(PosixTest):
+
+    def test_terminate_all(self):
+        sleeps = [PosixProcess('/bin/sleep 10') for i in range(5)]
+        stubborn = PosixProcess('/bin/sh', ['-c', 'trap "" TERM; sleep 10'])
+        exited = PosixProcess('/bin/true')
+        processes = sleeps + [stubborn, exited]
+        for process in processes:
+            process.start()
+        exited.wait()
+        time.sleep(0.1)
+        start = time.time()
+        assert terminate_all(processes, 1.0) == [True] * len(processes)
+        assert time.time() - start < 1.0
+        for sleep in sleeps:
+            assert sleep.termsig == signal.SIGTERM
+        assert stubborn.termsig == signal.SIGKILL
+        assert exited.exitstatus == 0
+
+
+class TestPosixSpawnProcess(PosixTest):
+
+    def test_process(self):
+        if not hasattr(os, 'posix_spawn'):
+            raise SkipTest('This test requires os.posix_spawn()')
+        r, w = os.pipe()
+        cat = PosixSpawnProcess('/bin/cat', closefds=True, keepfds=[w])
+        cat.start()
+        assert not os.get_inheritable(w)
+        cat.write(b'foo\n')
+        assert PosixNBIO(cat.fileno(), 2).read(100).startswith(b'foo')
+        if os.path.isdir('/proc/self/fd'):
+            fd = '/proc/%d/fd/%d'
+            assert os.readlink(fd % (cat.pid, w)) == \
+                        os.readlink(fd % (os.getpid(), w))
+            assert not os.path.exists(fd % (cat.pid, r))
+        # The pty is the controlling terminal, so ^C interrupts cat.
+        terminal = PosixTerminal(cat.fileno())
+        cat.write(terminal.cchar('VINTR'))
+        assert cat.wait(5)
+        assert cat.termsig == signal.SIGINT
+
+    def test_cwd(self):
+        tmpdir = self.tempdir()
+        pwd = PosixSpawnProcess('/bin/pwd', cwd=tmpdir)
+        pwd.start()
+        output = PosixNBIO(pwd.fileno(), 2).read(1000)
+        assert output.strip() == os.path.realpath(tmpdir).encode('ascii')
+        pwd.wait(5)
+
+
 class TestPosixTerminal(PosixTest):
 
     def test_echo(self):
@@ -100,9 +242,25 @@ class TestPosixTerminal(PosixTest):
         cat.write('foo\n')
         time.sleep(1)
         line = cat.read(20)
-        assert line == 'foo\r\nfoo\r\n'
+        assert line == b'foo\r\nfoo\r\n'
         cat.terminate()
 
+    def test_cached_attributes(self):
+        cat = PosixProcess('/bin/cat')
+        cat.start()
+        terminal = PosixTerminal(cat.fileno())
+        assert terminal.getecho() == True
+        other = PosixTerminal(cat.fileno())
+        other.setecho(False)
+        # The change is only seen after a refresh.
+        assert terminal.getecho() == True
+        terminal.refresh()
+        assert terminal.getecho() == False
+        assert other.getecho() == False
+        assert terminal.cchar('VEOF') == b'\x04'
+        cat.kill(signal.SIGKILL)
+        cat.wait(5)
+
     def test_noecho(self):
         cat = PosixProcess('/bin/cat')
         cat.start()
@@ -112,13 +270,13 @@ class TestPosixTerminal(PosixTest):
         cat.write('bar\n')
         time.sleep(1)
         line = cat.read(20)
-        assert line == 'bar\r\n'
+        assert line == b'bar\r\n'
         terminal.setecho(True)
         assert terminal.getecho() == True
         cat.write('baz\n')
         time.sleep(1)
         line = cat.read(20)
-        assert line == 'baz\r\nbaz\r\n'
+        assert line == b'baz\r\nbaz\r\n'
         cat.terminate()
 
     def test_eof(self):
@@ -148,6 +306,42 @@ class TestPosixNBIO(UnitTest):
         end = time.time()
         assert end - start > 1.0
 
+    def test_readinto(self):
+        r, w = os.pipe()
+        io = PosixNBIO(r)
+        io.settimeout(0)
+        buf = bytearray(10)
+        assert_raises(TIMEOUT, io.readinto, buf)
+        os.write(w, b'foo')
+        assert io.readinto(memoryview(buf)[2:]) == 3
+        assert buf[:5] == b'\0\0foo'
+
+    def test_high_fd(self):
+        import resource
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        if soft <= 2000:
+            if hard != resource.RLIM_INFINITY and hard <= 2000:
+                raise SkipTest('This test requires more than 2000 fds')
+            resource.setrlimit(resource.RLIMIT_NOFILE, (2048, hard))
+        r, w = os.pipe()
+        try:
+            os.dup2(r, 2000)
+            io = PosixNBIO(2000)
+            io.settimeout(0.1)
+            assert_raises(TIMEOUT, io.read, 1)
+            os.write(w, b'foo')
+            assert io.read(10) == b'foo'
+        finally:
+            os.close(2000)
+            resource.setrlimit(resource.RLIMIT_NOFILE, (soft, hard))
+
+    def test_available(self):
+        r, w = os.pipe()
+        io = PosixNBIO(r)
+        assert io.available() == 0
+        os.write(w, b'foo')
+        assert io.available() == 3
+
     def test_write(self):
         r, w = os.pipe()
         io = PosixNBIO(w)
@@ -185,3 +379,51 @@ class TestPosixNBIO(UnitTest):
         consumer.join()
         assert bytesread[0] == nbytes
         assert byteswritten == nbytes
+
+
+class TestWhich(PosixTest):
+
+    def _executable(self, dirname, name):
+        fname = os.path.join(dirname, name)
+        fout = open(fname, 'w')
+        fout.write('#!/bin/sh\n')
+        fout.close()
+        os.chmod(fname, 0o755)
+        return fname
+
+    def _age(self, *dirs):
+        for dirname in dirs:
+            os.utime(dirname, (time.time() - 60, time.time() - 60))
+
+    def test_which(self):
+        assert which('sh').endswith('/sh')
+        assert which('nonexistent-command') is None
+
+    def test_cache(self):
+        dir1, dir2 = self.tempdir(), self.tempdir()
+        path = os.pathsep.join([dir1, dir2])
+        foo2 = self._executable(dir2, 'foo')
+        self._age(dir1, dir2)
+        cache = WhichCache(interval=0)
+        assert cache.lookup('foo', path) == foo2
+        assert cache.lookup('foo', path) == foo2
+        assert (cache.hits, cache.misses) == (1, 1)
+        # Adding a file to a directory that was searched invalidates it.
+        foo1 = self._executable(dir1, 'foo')
+        assert cache.lookup('foo', path) == foo1
+        assert (cache.hits, cache.misses) == (1, 2)
+        self._age(dir1)
+        assert cache.lookup('foo', path) == foo1
+        assert cache.lookup('foo', path) == foo1
+        assert (cache.hits, cache.misses) == (2, 3)
+        # A change in permissions is not noticed until the cache is cleared.
+        os.chmod(foo1, 0o644)
+        assert cache.lookup('foo', path) == foo1
+        cache.clear()
+        assert cache.lookup('foo', path) == foo2
+
+    def test_relative(self):
+        cache = WhichCache()
+        assert cache.lookup('sh', os.pathsep.join(['', '/bin'])) == '/bin/sh'
+        assert cache.lookup('sh', os.pathsep.join(['', '/bin'])) == '/bin/sh'
+        assert cache.hits == 0
@@ -0,0 +1,84 @@
+#
+# This file is part of WinPexpect. WinPexpect is free software that is made
+# available under the MIT license. Consult the file "LICENSE" that is
+# distributed together with this file for the exact licensing terms.
+#
+# WinPexpect is copyright (c) 2010-2012 by the WinPexpect authors. See the
+# file "AUTHORS" for a complete overview.
+
+import os
+import time
+import signal
+
+from winpexpect.posix import PosixProcess
+from winpexpect.reaper import Reaper
+from winpexpect.test import *
+
+
+class TestReaper(PosixTest):
+
+    def setup(self):
+        super(TestReaper, self).setup()
+        self.reaper = Reaper()
+        self.reaper.start()
+
+    def teardown(self):
+        self.reaper.stop()
+        super(TestReaper, self).teardown()
+
+    def _process(self, command, args=None):
+        process = PosixProcess(command, args)
+        process.reaper = self.reaper
+        process.start()
+        return process
+
+    def test_exit_status(self):
+        proc = self._process('/bin/sh', ['-c', 'exit 3'])
+        assert proc.wait(5)
+        assert proc.exitstatus == 3
+        assert not proc.isalive()
+
+    def test_isalive(self):
+        proc = self._process('/bin/sleep', ['10'])
+        assert proc.isalive()
+        proc.kill(signal.SIGKILL)
+        assert proc.wait(5)
+        assert proc.termsig == signal.SIGKILL
+
+    def test_status_kept(self):
+        proc = self._process('/bin/true')
+        # The reaper reaps the child and keeps its status.
+        self.reaper.wait(proc.pid, 5)
+        assert_raises(OSError, os.waitpid, proc.pid, os.WNOHANG)
+        assert not proc.isalive()
+        assert proc.exitstatus == 0
+
+    def test_wait_latency(self):
+        proc = self._process('/bin/sleep', ['0.1'])
+        start = time.time()
+        assert proc.wait()
+        assert time.time() - start < 0.5
+
+    def test_stopped(self):
+        proc = self._process('/bin/sh', ['-c', 'exit 4'])
+        self.reaper.stop()
+        assert proc.wait(5)
+        assert proc.exitstatus == 4
+
+    def test_stopped_running(self):
+        proc = self._process('/bin/sleep', ['0.5'])
+        self.reaper.stop()
+        # Waiting must not spin now that the reaper thread is gone.
+        cpu = sum(os.times()[:2])
+        assert proc.wait(5)
+        assert sum(os.times()[:2]) - cpu < 0.2
+        assert proc.exitstatus == 0
+
+    def test_stopped_nopidfd(self):
+        proc = self._process('/bin/sleep', ['0.2'])
+        self.reaper.stop()
+        if proc.pidfd is not None:
+            os.close(proc.pidfd)
+            proc.pidfd = None
+        assert proc.wait()
+        assert proc.exitstatus == 0
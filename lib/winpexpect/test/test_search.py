@@ -6,12 +6,30 @@
 # WinPexpect is copyright (c) 2010-2012 by the WinPexpect authors. See the
 # file "AUTHORS" for a complete overview.
 
+import io
 import os
+import threading
 from textwrap import dedent
 
 from winpexpect import *
+from winpexpect import compat
 from winpexpect.test import *
 from winpexpect.exception import *
+from winpexpect.buffer import Buffer
+from winpexpect.search import (compile_patterns, compile_literals,
+        max_match_length)
+
+
+class ChunkStream(object):
+    """A stream that returns a fixed sequence of chunks."""
+
+    def __init__(self, chunks):
+        self.chunks = list(chunks)
+
+    def read(self, size):
+        if not self.chunks:
+            return ''
+        return self.chunks.pop(0)
 
 
 class TestSearch(UnitTest):
@@ -81,9 +99,297 @@ class TestSearch(UnitTest):
         fname = self.tempfile('line1\n')
         fd = os.open(fname, os.O_RDONLY)
         searcher = Searcher(fd)
-        ix = searcher.search('line1')
+        ix = searcher.search(b'line1')
         assert ix == 0
-        assert searcher.before == ''
-        assert searcher.after == 'line1'
+        assert searcher.before == b''
+        assert searcher.after == b'line1'
         assert hasattr(searcher.match, 'groups')
         assert searcher.match_index == 0
+
+    def test_pattern_set(self):
+        fname = self.tempfile(dedent("""\
+                line1
+                line2
+                line3
+                """))
+        fin = self.open(fname)
+        searcher = Searcher(fin)
+        patterns = PatternSet(['LINE1', 'line3', EOF], ignorecase=True)
+        ix = searcher.search(patterns)
+        assert ix == 0
+        assert searcher.after == 'line1'
+        ix = searcher.search(patterns)
+        assert ix == 1
+        assert searcher.before == '\nline2\n'
+        ix = searcher.search(patterns)
+        assert ix == 2
+        assert searcher.match is None
+
+    def test_compile_patterns_cache(self):
+        pset = compile_patterns(['foo', 'bar'])
+        assert isinstance(pset, PatternSet)
+        assert compile_patterns(['foo', 'bar']) is pset
+        assert compile_patterns(['foo', 'bar'], True) is not pset
+        assert compile_patterns('foo') is compile_patterns(['foo'])
+        assert_raises(TypeError, compile_patterns, [1])
+
+    def test_compile_patterns_threads(self):
+        errors = []
+        def compile():
+            try:
+                for i in range(1000):
+                    compile_patterns(['p%d' % (i % 150)])
+            except Exception as e:
+                errors.append(e)
+        threads = [threading.Thread(target=compile) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert not errors
+
+    def test_max_match_length(self):
+        assert max_match_length('abc') == 3
+        assert max_match_length('a{2,5}|b') == 5
+        assert max_match_length('a.*b') is None
+        assert max_match_length('a(?=b)') is None
+        assert max_match_length('(a)\\1') is None
+        assert max_match_length('(?<=a)b') == 1
+
+    def test_incremental(self):
+        chunks = ['xxxxxpro', 'mp', 't> yyy', 'yy\n', 'zz> ']
+        searcher = Searcher(ChunkStream(chunks))
+        ix = searcher.search(['prompt> ', 'y+\n'])
+        assert ix == 0
+        assert searcher.before == 'xxxxx'
+        ix = searcher.search(['prompt> ', 'y+\n'])
+        assert ix == 1
+        assert searcher.after == 'yyyyy\n'
+        ix = searcher.search(['zzz', EOF])
+        assert ix == 1
+        assert searcher.before == 'zz> '
+
+    def test_incremental_maxlen(self):
+        chunks = ['aaaa', 'abbb', 'bbc']
+        searcher = Searcher(ChunkStream(chunks))
+        ix = searcher.search(PatternSet('ab+c', maxlen=10))
+        assert ix == 0
+        assert searcher.before == 'aaaa'
+        assert searcher.after == 'abbbbbc'
+
+    def test_anchor_after_consume(self):
+        chunks = ['foo\nbar\n', 'baz\n']
+        searcher = Searcher(ChunkStream(chunks))
+        ix = searcher.search('\n')
+        assert ix == 0
+        ix = searcher.search('^b..')
+        assert ix == 0
+        assert searcher.after == 'bar'
+        assert searcher.buffer == '\n'
+        ix = searcher.search(['^baz', EOF])
+        assert ix == 1
+        assert searcher.before == '\nbaz\n'
+
+    def test_lazy_before_after(self):
+        size = 2 * Buffer.compact_threshold
+        chunks = [size * 'x' + 'foo', size * 'y' + 'bar']
+        searcher = Searcher(ChunkStream(chunks))
+        ix = searcher.search('foo')
+        assert ix == 0
+        ix = searcher.search('bar')
+        assert ix == 0
+        # The data was compacted away from under the previous match, but
+        # the second match should still give the right results.
+        assert searcher.after == 'bar'
+        assert searcher.before == size * 'y'
+        assert searcher.match.group(0) == 'bar'
+
+    def test_release(self):
+        chunks = ['foo bar baz']
+        searcher = Searcher(ChunkStream(chunks))
+        ix = searcher.search('ba.')
+        assert ix == 0
+        searcher.release()
+        assert searcher.before == 'foo '
+        assert searcher.after == 'bar'
+        assert searcher.match is None
+        assert searcher.buffer == ' baz'
+        ix = searcher.search('baz')
+        assert ix == 0
+        assert searcher.before == ' '
+
+    def test_search_exact(self):
+        chunks = ['foo $ b', 'ar.* baz', '$ ']
+        searcher = Searcher(ChunkStream(chunks))
+        ix = searcher.search_exact('$ ')
+        assert ix == 0
+        assert searcher.before == 'foo '
+        assert searcher.after == '$ '
+        assert searcher.match == '$ '
+        assert searcher.match_index == 0
+        ix = searcher.search_exact(['baz', 'bar.*', 'ar'])
+        assert ix == 1
+        assert searcher.before == ''
+        assert searcher.after == 'bar.*'
+        ix = searcher.search_exact(['$ ', ' b'])
+        assert ix == 1
+        assert searcher.before == ''
+        ix = searcher.search_exact(['nomatch', EOF])
+        assert ix == 1
+        assert searcher.before == 'az$ '
+        assert searcher.match is None
+
+    def test_literal_set(self):
+        literals = LiteralSet(['abc', 'b', EOF])
+        assert literals.maxlen == 3
+        assert literals.find('xabc', 0) == ((0, 1, 4, 'abc'), None)
+        assert literals.find('xabc', 2) == ((1, 2, 3, 'b'), None)
+        assert literals.find('xyz', 0) == (None, None)
+        literals = LiteralSet(['abc', 'b', EOF], automaton=True)
+        assert literals.find('xabc', 0) == ((0, 1, 4, 'abc'), None)
+        result, state = literals.find('xa', 0)
+        assert result is None
+        assert literals.find('xabc', 2, state) == ((0, 1, 4, 'abc'), None)
+        assert compile_literals(['abc', 'b', EOF]) is \
+                compile_literals(['abc', 'b', EOF])
+        assert_raises(TypeError, LiteralSet, [1])
+
+    def test_literal_set_prefix(self):
+        for patterns in (['ab', 'a'], ['abcd', 'ab'], ['a', 'ab'],
+                         ['x', 'abcd', 'ab']):
+            for data in ('ab', 'abcd', 'xabcd', 'aab'):
+                expected = LiteralSet(patterns).find(data, 0)
+                result = LiteralSet(patterns, automaton=True).find(data, 0)
+                assert result == expected
+        literals = LiteralSet(['abcd', 'ab'], automaton=True)
+        assert literals.find('abcd', 0) == ((0, 0, 4, 'abcd'), None)
+
+    def test_literal_set_end(self):
+        # A later string must not match beyond `end`.
+        literals = LiteralSet([b'a', b'xa\0\0'])
+        data = bytearray(b'xxa\0\0\0')
+        assert literals.find(data, 0, None, 3) == ((0, 2, 3, b'a'), None)
+
+    def test_automaton_window(self):
+        # The automaton state must not refer to data outside the window.
+        for automaton in (False, True):
+            literals = LiteralSet([b'ab'], automaton=automaton)
+            searcher = Searcher(ChunkStream([b'xxa', b'b']),
+                                searchwindowsize=1)
+            assert_raises(EOF, searcher.search_exact, literals)
+            searcher = Searcher(ChunkStream([b'xxa', b'b', b'ab']),
+                                searchwindowsize=2)
+            assert searcher.search_exact(literals) == 0
+            assert searcher.after == b'ab'
+
+    def test_search_exact_automaton(self):
+        chunks = ['foo $ b', 'ar.* baz', '$ ']
+        searcher = Searcher(ChunkStream(chunks))
+        literals = LiteralSet(['$ ', 'baz', 'bar.*', 'ar', EOF],
+                              automaton=True)
+        ix = searcher.search_exact(literals)
+        assert ix == 0
+        assert searcher.before == 'foo '
+        ix = searcher.search_exact(literals)
+        assert ix == 2
+        assert searcher.before == ''
+        assert searcher.after == 'bar.*'
+        ix = searcher.search_exact(literals)
+        assert ix == 1
+        assert searcher.before == ' '
+        ix = searcher.search_exact(literals)
+        assert ix == 0
+        ix = searcher.search_exact(literals)
+        assert ix == 4
+
+    def test_match_groups(self):
+        chunks = ['login: root\r\nuid=0(root)\r\n']
+        searcher = Searcher(ChunkStream(chunks))
+        patterns = PatternSet(['(?P<prompt>[a-z]+): (\\w+)',
+                               'uid=(\\d+)\\((?P<user>\\w+)\\)'])
+        ix = searcher.search(patterns)
+        assert ix == 0
+        assert searcher.match.group('prompt') == 'login'
+        assert patterns.groups(searcher.match) == ('login', 'root')
+        ix = searcher.search(patterns)
+        assert ix == 1
+        assert searcher.match.group('user') == 'root'
+        assert patterns.groups(searcher.match) == ('0', 'root')
+
+    def test_decode(self):
+        data = u'caf\xe9 \u20ac> '.encode('utf-8')
+        chunks = [data[:4], data[4:7], data[7:]]
+        searcher = Searcher(ChunkStream(chunks), encoding='utf-8')
+        ix = searcher.search(u'\u20ac> ')
+        assert ix == 0
+        assert searcher.before == u'caf\xe9 '
+        assert isinstance(searcher.before, compat.unicode)
+
+    def test_binary(self):
+        data = u'caf\xe9 \u20ac> '.encode('utf-8')
+        chunks = [data[:4], data[4:7], data[7:]]
+        searcher = Searcher(ChunkStream(chunks), encoding='utf-8',
+                            binary=True)
+        ix = searcher.search(b'> ')
+        assert ix == 0
+        assert searcher.before == data[:-2]
+        assert isinstance(searcher.before, bytes)
+        assert searcher.decode(searcher.before) == u'caf\xe9 \u20ac'
+        # Text patterns are encoded.
+        searcher = Searcher(ChunkStream(chunks), encoding='utf-8',
+                            binary=True)
+        assert searcher.search_exact(u'\u20ac') == 0
+        assert searcher.after == u'\u20ac'.encode('utf-8')
+        assert searcher.search([u'x', u'> ']) == 1
+
+    def test_adaptive_read_policy(self):
+        policy = AdaptiveReadPolicy(100, 1000)
+        available = lambda: 5000
+        assert policy.size(available) == 100
+        policy.update(100, 100)
+        assert policy.size(available) == 1000
+        policy.update(1000, 1000)
+        assert policy.size(lambda: 300) == 300
+        policy.update(300, 10)
+        assert policy.size(available) == 150
+        policy.update(150, 10)
+        assert policy.size(available) == 100
+        policy.update(100, 100)
+        assert policy.size(lambda: None) == 200
+
+    def test_read_policy(self):
+        sizes = []
+        class Stream(io.BytesIO):
+            def readinto(self, buf):
+                sizes.append(len(buf))
+                return io.BytesIO.readinto(self, buf)
+        data = 1500 * b'x' + b'$ '
+        searcher = Searcher(Stream(data),
+                            readpolicy=AdaptiveReadPolicy(100, 1000))
+        searcher.search(b'\\$ ')
+        assert sizes == [100, 200, 400, 800, 1000]
+        del sizes[:]
+        searcher = Searcher(Stream(data), maxread=1000)
+        searcher.search(b'\\$ ')
+        assert sizes == [1000, 1000]
+
+    def test_readinto(self):
+        class Stream(io.BytesIO):
+            def read(self, size):
+                raise AssertionError('read() should not be called')
+        searcher = Searcher(Stream(b'foo\r\n$ bar'))
+        assert searcher.search(b'\\$ ') == 0
+        assert searcher.before == b'foo\r\n'
+        assert searcher.after == b'$ '
+        assert isinstance(searcher._buffer.data, bytearray)
+        assert searcher.search_exact(b'bar') == 0
+        assert searcher.before == b''
+
+    def test_readinto_fallback(self):
+        class Searcher2(Searcher):
+            def readinto(self, buf):
+                return None
+        searcher = Searcher2(io.BytesIO(b'foo$ '))
+        assert searcher.search(b'\\$ ') == 0
+        assert searcher.before == b'foo'
+        assert not searcher._readinto
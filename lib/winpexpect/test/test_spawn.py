@@ -7,6 +7,9 @@
 # file "AUTHORS" for a complete overview.
 
 import os
+import gc
+
+from nose import SkipTest
 
 import winpexpect
 from winpexpect import *
@@ -24,7 +27,66 @@ class TestSpawnPosix(PosixTest):
         shell.expect('\r\n')
         shell.expect('\r\n')
         uname = shell.before
-        assert uname == os.uname()[0]
+        assert uname == os.uname()[0].encode('ascii')
+
+    def test_expect_exact(self):
+        env = { 'PS1': '$ ', 'HOME': os.getcwd() }
+        shell = spawn('/bin/sh', env=env, timeout=2)
+        shell.expect_exact('$ ')
+        shell.send('echo "a.b"\n')
+        # The shell echos the command
+        shell.expect_exact('"a.b"\r\n')
+        shell.expect_exact('a.b\r\n')
+        assert shell.after == b'a.b\r\n'
+        shell.expect_exact('$ ')
+
+    def test_spawn_text(self):
+        env = { 'PS1': '$ ', 'HOME': os.getcwd(), 'LANG': 'C.UTF-8' }
+        shell = spawn('/bin/sh', env=env, timeout=2, text=True)
+        shell.expect_exact(u'$ ')
+        shell.send(u'echo caf\xe9\n')
+        shell.expect(u'\r\n')
+        shell.expect(u'\r\n')
+        assert shell.before == u'caf\xe9'
+
+    def test_spawn_binary(self):
+        env = { 'PS1': '$ ', 'HOME': os.getcwd(), 'LANG': 'C.UTF-8' }
+        shell = spawn('/bin/sh', env=env, timeout=2)
+        shell.expect_exact(b'$ ')
+        shell.send(b'echo caf\xc3\xa9\n')
+        shell.expect(b'\r\n')
+        shell.expect(b'\r\n')
+        assert shell.before == b'caf\xc3\xa9'
+        assert shell.decode(shell.before) == u'caf\xe9'
+
+    def test_text_patterns(self):
+        # Text patterns are encoded when the output is not decoded.
+        env = { 'HOME': os.getcwd(), 'LANG': 'C.UTF-8' }
+        cat = spawn('/bin/cat', env=env, timeout=2)
+        cat.send(b'caf\xc3\xa9\n')
+        cat.expect_exact(u'caf\xe9')
+        assert cat.after == b'caf\xc3\xa9'
+        cat.send(b'foo\n')
+        cat.expect(u'fo+')
+        assert cat.after == b'foo'
+        cat.kill(9)
+        cat.wait()
+
+    def test_spawn_invalid_utf8(self):
+        # The output is not decoded by default, even if it is invalid.
+        env = { 'HOME': os.getcwd(), 'LANG': 'C.UTF-8' }
+        shell = spawn('/bin/sh', ['-c', 'printf "abc\\377def"'], env=env,
+                      timeout=2)
+        shell.expect(b'def')
+        assert shell.before == b'abc\xff'
+        assert isinstance(shell.before, bytes)
+
+    def test_expect_eof(self):
+        # The pty returns EIO once the child has exited.
+        echo = spawn('/bin/echo', ['foo'], timeout=2)
+        assert echo.expect(EOF) == 0
+        assert echo.before == b'foo\r\n'
+        echo.wait()
 
     def test_spawn_gevent(self):
         if not hasattr(winpexpect, 'GEventNBIO'):
@@ -37,4 +99,122 @@ class TestSpawnPosix(PosixTest):
         shell.expect('\r\n')
         shell.expect('\r\n')
         uname = shell.before
-        assert uname == os.uname()[0]
+        assert uname == os.uname()[0].encode('ascii')
+
+    def test_spawn_class(self):
+        cat1 = spawn('/bin/cat', timeout=2)
+        cat2 = spawn('/bin/cat', timeout=2)
+        assert isinstance(cat1, Spawn)
+        assert type(cat1) is type(cat2)
+        assert 'expect' not in cat1.__dict__
+        cat1.send(b'foo\n')
+        cat1.expect(b'foo')
+        assert cat1.after == b'foo'
+        cat1.terminate()
+        cat2.terminate()
+
+    def test_close_release(self):
+        cat = spawn('/bin/cat', timeout=2)
+        cat.send(b'foo bar\n')
+        cat.expect(b'fo+')
+        assert cat.match is not None
+        cat.close()
+        assert cat.ptyfd is None
+        assert cat.match is None
+        assert cat.before == b''
+        assert cat.after == b'foo'
+        cat.kill(9)
+        cat.wait()
+
+    def test_idle_memory(self):
+        try:
+            import tracemalloc
+        except ImportError:
+            raise SkipTest('This test requires tracemalloc')
+        env = { 'PS1': '$ ', 'HOME': os.getcwd(), 'LANG': 'C.UTF-8' }
+        def idle_shell():
+            shell = spawn('/bin/sh', env=env, timeout=5)
+            shell.expect_exact(b'$ ')
+            # Make the read size and the buffer grow.
+            shell.send(b'seq 1 5000\n')
+            shell.expect_exact(b'$ ')
+            shell.send(b'true\n')
+            shell.expect_exact(b'$ ')
+            shell.release()
+            return shell
+        count = 20
+        shells = [idle_shell()]
+        gc.collect()
+        tracemalloc.start()
+        try:
+            before = tracemalloc.get_traced_memory()[0]
+            shells += [idle_shell() for i in range(count)]
+            gc.collect()
+            after = tracemalloc.get_traced_memory()[0]
+        finally:
+            tracemalloc.stop()
+            for shell in shells:
+                shell.kill(9)
+                shell.wait()
+        assert (after - before) / count < 4096
+
+    def test_template(self):
+        env = { 'PS1': '$ ', 'HOME': os.getcwd(), 'LANG': 'C.UTF-8' }
+        modes = TerminalModes(echo=False, winsize=(40, 120))
+        template = SpawnTemplate('sh', env=env, timeout=2, termmodes=modes)
+        assert template.path.endswith('/sh')
+        assert template.config.args == ['sh']
+        assert template.config.encoding == 'utf-8'
+        env['PS1'] = '# '
+        shell = template.spawn()
+        shell.expect_exact(b'$ ')
+        assert shell.getwinsize() == (40, 120)
+        assert not shell.getecho()
+        shell.send(b'echo foo\n')
+        shell.expect_exact(b'$ ')
+        assert shell.before == b'foo\r\n'
+        shell.kill(9)
+        shell.wait()
+
+    def test_spawn_many(self):
+        template = SpawnTemplate('/bin/cat', timeout=2)
+        cats = spawn_many(template, 5)
+        assert len(set(cat.pid for cat in cats)) == 5
+        assert cats[0]._config is cats[1]._config is template.config
+        assert 'env' not in cats[0].__dict__
+        cats[0].searchwindowsize = 10
+        assert cats[0].searchwindowsize == 10
+        assert cats[1].searchwindowsize is None
+        assert template.config.searchwindowsize is None
+        for cat in cats:
+            cat.send(b'foo\n')
+            cat.expect_exact(b'foo')
+            cat.kill(9)
+            cat.wait()
+        assert_raises(ProcessError, SpawnTemplate, 'nonexistent-command')
+
+    def test_template_quoted(self):
+        # The command line is parsed once, when the template is created.
+        dirname = os.path.join(self.tmpdir, "it's dir")
+        os.mkdir(dirname)
+        os.symlink('/bin/cat', os.path.join(dirname, 'cat'))
+        template = SpawnTemplate('"%s/cat"' % dirname, timeout=2)
+        assert template.config.args == [dirname + '/cat']
+        cats = spawn_many(template, 2)
+        for cat in cats:
+            assert cat.args == template.config.args
+            cat.send(b'foo\n')
+            cat.expect_exact(b'foo')
+            cat.kill(9)
+            cat.wait()
+
+    def test_termmodes(self):
+        modes = TerminalModes(echo=False, onlcr=False)
+        cat = spawn('/bin/cat', timeout=2, termmodes=modes)
+        cat.send(b'foo\nbar\n')
+        cat.expect_exact(b'\n')
+        assert cat.before == b'foo'
+        cat.expect_exact(b'bar\n')
+        assert cat.before == b''
+        cat.kill(9)
+        cat.wait()